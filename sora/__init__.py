@@ -1,7 +1,7 @@
 from .ephem import EphemKernel, EphemPlanete, EphemJPL
 from .observer import Observer
 from .star import Star
-from .lightcurve import LightCurve
+from .lightcurve import LightCurve, LightCurveSet
 from .occultation import Occultation
 from .body import *
 
@@ -0,0 +1,134 @@
+import json
+import platform
+import time
+import datetime
+import numpy as np
+from .synthetic import synthetic_lightcurve
+
+
+def _timeit(function, repeat):
+    """ Returns the shortest time of repeat calls of function, in seconds
+    """
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def _load(results):
+    """ Returns the benchmark results, reading them if a JSON file is given
+    """
+    if isinstance(results, str):
+        with open(results) as f:
+            return json.load(f)
+    return results
+
+
+def run_benchmark(npts=(1000, 10000), d_stars=(0.0, 1.0), repeat=3, output=None, label=None, model_kwargs=None,
+                  detect_kwargs=None, lcfit_kwargs=None, normalize_kwargs=None, seed=0):
+    """ Times occ_model(), occ_detect(), occ_lcfit() and normalize() on synthetic light curves.
+
+    For each number of points and star diameter, a light curve of 50 seconds with an occultation
+    of 10 seconds at 20 km/s and 40 AU is simulated, with the exposure time equal to the cycle and
+    a noise of 5%. Each method is called repeat times and the shortest time is kept. The model cache
+    of the light curves is disabled.
+
+    Parameters:
+        npts (list): Numbers of points of the light curves. Default=(1000, 10000)
+        d_stars (list): Star diameters, in km. Default=(0.0, 1.0)
+        repeat (int): Number of calls of each method. Default=3
+        output (str): JSON file where the results are saved. Default=None
+        label (str): Name of the run, e.g. the engine being tested. Default=None
+        model_kwargs (dict): Parameters given to occ_model(), e.g. {'star_method': 'fft'}. Default=None
+        detect_kwargs (dict): Parameters given to occ_detect(). Default=None
+        lcfit_kwargs (dict): Parameters given to occ_lcfit(). Default={'loop': 1000}
+        normalize_kwargs (dict): Parameters given to normalize(). Default=None
+        seed (int): Seed of the noise and of occ_lcfit(). Default=0
+
+    Returns:
+        results (dict): Dictionary with the label, the date, the versions of sora, python and numpy,
+            the platform, the parameters and the 'cases', a list with the number of points ('npts'),
+            the star diameter ('d_star') and the time of each method, in seconds.
+    """
+    import sora
+    model_kwargs = model_kwargs or {}
+    detect_kwargs = detect_kwargs or {}
+    lcfit_kwargs = dict({'loop': 1000, 'seed': seed}, **(lcfit_kwargs or {}))
+    normalize_kwargs = normalize_kwargs or {}
+    immersion_time, emersion_time, span = 20.0, 30.0, 50.0
+    cases = []
+    for n in npts:
+        for d_star in d_stars:
+            cycle = span/n
+            lc = synthetic_lightcurve('benchmark_{}_{}_{}'.format(n, d_star, time.time_ns()), immersion_time,
+                                      emersion_time, vel=20.0, dist=40.0, d_star=d_star, exptime=cycle, noise=0.05,
+                                      tmin=0.0, tmax=span - cycle, seed=seed)
+            lc.set_model_cache(0)
+            mask = np.ones(len(lc.time), dtype=bool)
+            case = {'npts': len(lc.time), 'd_star': d_star}
+            case['occ_model'] = _timeit(lambda: lc.occ_model(immersion_time, emersion_time, 1.0, mask,
+                                                             **model_kwargs), repeat)
+            case['occ_detect'] = _timeit(lambda: lc.occ_detect(**detect_kwargs), repeat)
+            case['occ_lcfit'] = _timeit(lambda: lc.occ_lcfit(**lcfit_kwargs), repeat)
+            case['normalize'] = _timeit(lambda: lc.normalize(**normalize_kwargs), repeat)
+            cases.append(case)
+            del lc
+    date = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    results = {'label': label, 'date': date, 'sora_version': sora.__version__,
+               'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+               'parameters': {'repeat': repeat, 'seed': seed, 'model_kwargs': model_kwargs,
+                              'detect_kwargs': detect_kwargs, 'lcfit_kwargs': lcfit_kwargs,
+                              'normalize_kwargs': normalize_kwargs},
+               'cases': cases}
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+def compare_benchmarks(reference, current, tolerance=0.2):
+    """ Compares two benchmark runs, matching the cases by number of points and star diameter.
+
+    Parameters:
+        reference (str, dict): Results of the reference run, or the JSON file where they were saved.
+        current (str, dict): Results of the run to be compared, or the JSON file where they were saved.
+        tolerance (float): Relative slowdown above which a method is flagged as a regression. Default=0.2
+
+    Returns:
+        comparison (list): List of dictionaries with 'npts', 'd_star', 'method', the 'reference' and
+            'current' times, in seconds, their 'ratio' (current/reference) and 'regression' (bool),
+            for each method of each case present in both runs.
+    """
+    reference = {(case['npts'], case['d_star']): case for case in _load(reference)['cases']}
+    comparison = []
+    for case in _load(current)['cases']:
+        key = (case['npts'], case['d_star'])
+        if key not in reference:
+            continue
+        for method in ['occ_model', 'occ_detect', 'occ_lcfit', 'normalize']:
+            if method not in case or method not in reference[key]:
+                continue
+            ratio = case[method]/reference[key][method]
+            comparison.append({'npts': key[0], 'd_star': key[1], 'method': method,
+                               'reference': reference[key][method], 'current': case[method],
+                               'ratio': ratio, 'regression': ratio > 1 + tolerance})
+    return comparison
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Times the LightCurve methods on synthetic light curves.')
+    parser.add_argument('output', help='JSON file where the results are saved')
+    parser.add_argument('--npts', type=int, nargs='+', default=[1000, 10000], help='numbers of points')
+    parser.add_argument('--d_star', type=float, nargs='+', default=[0.0, 1.0], help='star diameters, in km')
+    parser.add_argument('--repeat', type=int, default=3, help='number of calls of each method')
+    parser.add_argument('--label', default=None, help='name of the run')
+    parser.add_argument('--compare', default=None, help='JSON file of a reference run')
+    args = parser.parse_args()
+    results = run_benchmark(npts=args.npts, d_stars=args.d_star, repeat=args.repeat, output=args.output,
+                            label=args.label)
+    for row in compare_benchmarks(args.compare, results) if args.compare else []:
+        print('{npts:>8} points, d_star={d_star:<5} {method:<10} {reference:9.4f}s -> {current:9.4f}s '
+              '({ratio:.2f}x){flag}'.format(flag=' REGRESSION' if row['regression'] else '', **row))
@@ -1,3 +1,6 @@
+import os
+import tempfile
+import time
 import matplotlib.pyplot as plt
 import numpy as np
 import astropy.units as u
@@ -55,6 +58,122 @@ def draw_ellipse(equatorial_radius, oblateness=0.0, center_f=0.0, center_g=0.0,
     plt.axis('equal')
 
 
+class ColumnStore():
+    def __init__(self, names, capacity=1024, dtype=float, scratch=None):
+        """ Stores columns of the same length that grow by blocks, e.g. the tests of a fit.
+
+        The columns are kept in one array whose capacity is doubled when it is full, so appending
+        n values costs O(n) in total, instead of copying all the previous values at each append.
+
+        Parameters:
+            names (list): Names of the columns.
+            capacity (int): Initial number of values allocated for each column. Default=1024
+            dtype (dtype): Data type of the columns. Default=float
+            scratch (str): Directory where the columns are memory-mapped to a temporary file, instead
+                of being kept in memory. Default=None
+
+        Example:
+
+        store = ColumnStore(['chi2', 'immersion'])
+        store.append(chi2=chi2, immersion=t1, tested=1000)
+        store.keep(store['chi2'] < store['chi2'].min() + 10)
+        chisquare = store.to_chisquare(npts)
+        """
+        if scratch is not None and not os.path.isdir(scratch):
+            raise ValueError('{} is not a directory'.format(scratch))
+        self.names = list(names)
+        self.scratch = scratch
+        self.__data = self.__new_array(max(1, int(capacity)), dtype)
+        self.__size = 0
+        self.tested = 0
+        self.appended = 0
+        self.iterations = 0
+        self.__start = time.perf_counter()
+
+    def append(self, values=None, tested=None, **kwargs):
+        """ Appends values to the end of the columns.
+
+        Parameters:
+            values (array): Array with shape (number of columns, n), with the columns in the order of names.
+            tested (int): Number of tests that produced these values, for the progress counters.
+                Default=n
+            **kwargs: The columns given by name, instead of values. All the columns must be given.
+        """
+        if values is None:
+            if set(kwargs) != set(self.names):
+                raise ValueError('All the columns {} must be given'.format(self.names))
+            values = [kwargs[name] for name in self.names]
+        values = np.asarray(values)
+        if values.ndim != 2 or values.shape[0] != len(self.names):
+            raise ValueError('values must have shape ({}, n)'.format(len(self.names)))
+        n = values.shape[1]
+        if self.__size + n > self.__data.shape[1]:
+            capacity = max(2*self.__data.shape[1], self.__size + n)
+            data = self.__new_array(capacity, self.__data.dtype)
+            data[:, :self.__size] = self.__data[:, :self.__size]
+            self.__data = data
+        self.__data[:, self.__size:self.__size + n] = values
+        self.__size += n
+        self.appended += n
+        self.tested += n if tested is None else tested
+        self.iterations += 1
+
+    def keep(self, mask):
+        """ Keeps only the values where mask is True, in place.
+
+        Parameters:
+            mask (array): Boolean array with the length of the columns.
+        """
+        index = np.flatnonzero(mask)
+        self.__data[:, :len(index)] = self.__data[:, index]
+        self.__size = len(index)
+
+    def progress(self):
+        """ Returns the progress counters.
+
+        Returns:
+            progress (dict): Dictionary with the number of appends ('iterations'), of tests ('tested'),
+                of values appended ('appended') and kept ('kept'), the elapsed time since the store
+                was created ('elapsed', in seconds) and the number of tests per second ('throughput').
+        """
+        elapsed = time.perf_counter() - self.__start
+        return {'iterations': self.iterations, 'tested': self.tested, 'appended': self.appended,
+                'kept': self.__size, 'elapsed': elapsed, 'throughput': self.tested/elapsed if elapsed > 0 else 0.0}
+
+    def to_chisquare(self, npts, chi2='chi2'):
+        """ Creates a ChiSquare object with copies of the columns.
+
+        Parameters:
+            npts (int): Number of points used in the fit.
+            chi2 (str): Name of the column with the chi-square. Default='chi2'
+
+        Returns:
+            chisquare (ChiSquare): ChiSquare object with the other columns as parameters.
+        """
+        columns = {name: self[name].copy() for name in self.names}
+        return ChiSquare(columns.pop(chi2), npts, **columns)
+
+    def __new_array(self, capacity, dtype):
+        """ Private function that returns an array for the columns with the given capacity,
+            memory-mapped to a temporary file in the scratch directory if it was given
+        """
+        if self.scratch is None:
+            return np.empty((len(self.names), capacity), dtype=dtype)
+        return np.memmap(tempfile.TemporaryFile(dir=self.scratch), dtype=dtype, mode='w+',
+                         shape=(len(self.names), capacity))
+
+    def __getitem__(self, name):
+        """ Returns a view of the values of the column name
+        """
+        if name not in self.names:
+            raise ValueError('{} is not one of the available columns. Please choose one of {}'
+                             .format(name, self.names))
+        return self.__data[self.names.index(name), :self.__size]
+
+    def __len__(self):
+        return self.__size
+
+
 class ChiSquare():
     def __init__(self, chi2, npts, **kwargs):
         """ Stores the arrays for all inputs and given chi-square.
@@ -1,16 +1,26 @@
 import numpy as np
 import matplotlib.pylab as pl
 import astropy.units as u
-from astropy.timeseries import BoxLeastSquares
 from astropy.time import Time
+from astropy.table import Table, Column, MaskedColumn
 import scipy.special as scsp
+from scipy.signal import fftconvolve
+from scipy.ndimage import maximum_filter1d
+from scipy.linalg import solve_triangular
 from scipy.odr import odrpack as odr
 from scipy.odr import models
 from .extra import ChiSquare
 from sora.config import input_tests
 import os
 import warnings
-from sora.config.decorators import deprecated_alias
+import functools
+import itertools
+import tempfile
+import glob
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from sora.config.decorators import deprecated_alias, next_major_version
 
 
 warnings.simplefilter('always', UserWarning)
@@ -52,6 +62,1025 @@ def fit_pol(x, y, deg):
     return param, param_err
 
 
+def fit_pol_nested(x, y, max_deg):
+    """ Fits the polynoms of degree 0 to max_deg to the data with a single QR factorization.
+        (The basis are the Legendre polynomials of x scaled to [-1, 1], so the fit of degree n
+        is the least squares solution with the first n+1 columns of the same factorization)
+
+    Parameters:
+        x (array): x-values
+        y (array): y-values
+        max_deg (int): highest degree of the polynoms
+
+    Returns:
+        params (list): The fitted values of each degree, highest degree first as in fit_pol()
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) <= max_deg:
+        raise ValueError('At least {} points are needed to fit a polynom of degree {}'.format(max_deg+1, max_deg))
+    domain = [x.min(), x.max()] if x.max() > x.min() else [x.min() - 1, x.min() + 1]
+    u = np.polynomial.polyutils.mapdomain(x, domain, [-1, 1])
+    q, r = np.linalg.qr(np.polynomial.legendre.legvander(u, max_deg))
+    qty = q.T @ y
+    params = []
+    for deg in range(max_deg + 1):
+        coef = solve_triangular(r[:deg+1, :deg+1], qty[:deg+1])
+        poly = np.polynomial.Legendre(coef, domain=domain).convert(kind=np.polynomial.Polynomial)
+        params.append(np.pad(poly.coef, (0, deg + 1 - len(poly.coef)))[::-1])
+    return params
+
+
+class FresnelTable():
+    """ Tabulated Fresnel integrals, in units of the Fresnel scale.
+
+    The integrals S and C are tabulated with a regular step from -limit to +limit and
+    interpolated with cubic Hermite polynomials using their exact derivatives.
+    Values outside the table are computed directly with scipy.special.fresnel.
+    When the input is a regular grid whose step is a multiple of the table step,
+    the interpolation weights are the same for all values and only slices of the table are used.
+    """
+    def __init__(self, step=0.005, limit=100.0):
+        """ Builds the table
+
+        Parameters:
+            step (int, float): Step of the table, in units of the Fresnel scale. Default=0.005
+                The interpolation error is about (pi*|x|)**3*step**4/384.
+            limit (int, float): Maximum absolute value tabulated, in units of the Fresnel scale. Default=100
+        """
+        if step <= 0 or limit <= 0:
+            raise ValueError('step and limit must be positive')
+        self.step = step
+        self.nhalf = int(np.ceil(limit/step))
+        self.limit = self.nhalf*step
+        x = np.arange(-self.nhalf, self.nhalf+1)*step
+        self.s, self.c = scsp.fresnel(x)
+        self.ds = np.sin(np.pi*x**2/2)*step
+        self.dc = np.cos(np.pi*x**2/2)*step
+
+    def __call__(self, x):
+        """ Returns the Fresnel integrals S and C, with the same behaviour as scipy.special.fresnel
+
+        Parameters:
+            x (int, float, array): values in units of the Fresnel scale.
+
+        Returns:
+            s, c (array): Fresnel integrals
+        """
+        x = np.asarray(x, dtype=float)
+        if x.ndim == 1 and x.size > 2:
+            m = int(round((x[-1] - x[0])/((x.size - 1)*self.step)))
+            if m > 0 and np.absolute(x - (x[0] + np.arange(x.size)*m*self.step)).max() < 1e-6*self.step:
+                return self.__regular(x, m)
+        return self.__scattered(x)
+
+    def __hermite(self, t, k0, k1):
+        """ Interpolates S and C between the indexes k0 and k1 of the table
+        """
+        t2 = t*t
+        t3 = t2*t
+        h00 = 2*t3 - 3*t2 + 1
+        h10 = t3 - 2*t2 + t
+        h01 = 3*t2 - 2*t3
+        h11 = t3 - t2
+        s = h00*self.s[k0] + h10*self.ds[k0] + h01*self.s[k1] + h11*self.ds[k1]
+        c = h00*self.c[k0] + h10*self.dc[k0] + h01*self.c[k1] + h11*self.dc[k1]
+        return s, c
+
+    def __regular(self, x, m):
+        """ Interpolates a regular grid with step m*self.step
+        """
+        n = x.size
+        s, c = np.empty(n), np.empty(n)
+        q = x[0]/self.step + self.nhalf
+        i0 = int(np.floor(q))
+        # range of the grid inside the table
+        ja = min(max(0, -(i0//m)), n)
+        jb = min(max(ja, (2*self.nhalf - 1 - i0)//m + 1), n)
+        if jb > ja:
+            k0 = slice(i0 + ja*m, i0 + (jb-1)*m + 1, m)
+            k1 = slice(i0 + ja*m + 1, i0 + (jb-1)*m + 2, m)
+            s[ja:jb], c[ja:jb] = self.__hermite(q - i0, k0, k1)
+        s[:ja], c[:ja] = scsp.fresnel(x[:ja])
+        s[jb:], c[jb:] = scsp.fresnel(x[jb:])
+        return s, c
+
+    def __scattered(self, x):
+        """ Interpolates values in any order
+        """
+        s, c = np.empty(x.shape), np.empty(x.shape)
+        q = x/self.step + self.nhalf
+        inside = (q >= 0) & (q < 2*self.nhalf)
+        k0 = q[inside].astype(int)
+        s[inside], c[inside] = self.__hermite(q[inside] - k0, k0, k0+1)
+        s[~inside], c[~inside] = scsp.fresnel(x[~inside])
+        return s, c
+
+
+@functools.lru_cache(maxsize=16)
+def fresnel_table(step=0.005, limit=100.0):
+    """ Returns a FresnelTable shared by all the LightCurve objects.
+        The last 16 tables are kept in memory (least recently used cache).
+
+    Parameters:
+        step (int, float): Step of the table, in units of the Fresnel scale. Default=0.005
+        limit (int, float): Maximum absolute value tabulated, in units of the Fresnel scale. Default=100
+
+    Returns:
+        table (FresnelTable): The Fresnel table.
+    """
+    return FresnelTable(step=step, limit=limit)
+
+
+def bar_fresnel(X, X01, X02, fresnel_scale, opacity, table=None):
+    """ Returns the modelled light curve considering fresnel difraction.
+
+    Parameters:
+        X (array): Array with time values converted in km using the event velocity.
+        X01 (int, float): Immersion time converted in km using the event velocity.
+        X02 (int, float): Emersion time converted in km using the event velocity.
+        fresnel_scale (int, float): Fresnel scale, in km.
+        opacity (int, float): Opacity. Opaque = 1.0, transparent = 0.0
+        table (FresnelTable): If given, the Fresnel integrals are interpolated from the table.
+            Default=None
+
+    Returns:
+        flux_fresnel (array): the light curve with fresnel diffraction
+    """
+    # Converting from km to units of fresnel scale
+    x = X/fresnel_scale
+    x01 = X01/fresnel_scale
+    x02 = X02/fresnel_scale
+    # Fresnel difraction parameters
+    x1 = x - x01
+    x2 = x - x02
+    fresnel = scsp.fresnel if table is None else table
+    s1, c1 = fresnel(x1)
+    s2, c2 = fresnel(x2)
+    cc = c1 - c2
+    ss = s1 - s2
+    r_ampli = - (cc+ss)*(opacity/2.)
+    i_ampli = (cc-ss)*(opacity/2.)
+    # Determining the flux considering fresnel difraction
+    flux_fresnel = (1.0 + r_ampli)**2 + (i_ampli)**2
+    return flux_fresnel
+
+
+def star_fresnel(X, X01, X02, fresnel_scale, opacity, d_star, npt_star=12, method='direct'):
+    """ Returns the modelled light curve considering fresnel difraction averaged over the stellar disk.
+
+    The disk is sampled in 2*npt_star points from -d_star to d_star, weighted
+    by the chord of the disk at each point.
+
+    Parameters:
+        X (array): Array with time values converted in km using the event velocity.
+        X01 (int, float): Immersion time converted in km using the event velocity.
+        X02 (int, float): Emersion time converted in km using the event velocity.
+        fresnel_scale (int, float): Fresnel scale, in km.
+        opacity (int, float): Opacity. Opaque = 1.0, transparent = 0.0
+        d_star (int, float): Stellar diameter, in km.
+        npt_star (int): Number of subdivisions for computing the star size's effects. Default=12
+        method (str): 'direct' evaluates the diffraction at every point of the disk for each
+            value of X, in vectorized blocks. 'fft' evaluates the diffraction once on a regular grid,
+            with a step that divides the step of the disk and resolves the fringes of both edges, and
+            convolves it with the disk profile, so the points of the disk are the same as in 'direct'.
+            Its result is linearly interpolated to X and agrees with 'direct' within 1e-3 of the
+            normalized flux (below 5e-4 in tests with npt_star from 3 to 30 and stellar diameters
+            from 0.03 to 16 km). The 'fft' cost grows only slowly with the number of values in X.
+            Default='direct'
+
+    Returns:
+        flux_star (array): the light curve with fresnel diffraction and stellar diameter
+    """
+    X = np.asarray(X, dtype=float)
+    resolution = d_star/npt_star
+    p = np.arange(-npt_star, npt_star)*resolution
+    coeff = np.sqrt(np.absolute(d_star**2 - p**2))
+    coeff = coeff/coeff.sum()
+    flux_star = np.zeros(X.shape)
+    if X.size == 0:
+        return flux_star
+    if method == 'direct':
+        # blocks of X are evaluated at once to limit the memory used by the 2D array
+        step = max(1, 2**20//len(p))
+        for i in range(0, X.size, step):
+            xx = X[i:i+step, None] + p
+            flux_star[i:i+step] = bar_fresnel(xx, X01, X02, fresnel_scale, opacity) @ coeff
+    elif method == 'fft':
+        # grid points per fresnel scale near the edges
+        samples = 32
+        # groups of X separated by more than a stellar diameter are convolved independently
+        order = np.argsort(X)
+        xs = X[order]
+        breaks = np.where(np.diff(xs) > 2*d_star)[0] + 1
+        for group in np.split(np.arange(X.size), breaks):
+            x_min = xs[group[0]]
+            # The fringes of an edge at a distance D have a period of about 2*fresnel_scale**2/D and
+            # an amplitude of about fresnel_scale/D, so the error of their linear interpolation grows as
+            # step**2*D. The grid step divides the disk step, so the disk points fall on the grid.
+            distance = max(np.absolute(xs[group[[0, -1]]] - X0).max() for X0 in [X01, X02]) + d_star
+            sub = int(np.ceil(resolution*samples/fresnel_scale*np.sqrt((fresnel_scale + distance)/fresnel_scale)))
+            step = resolution/sub
+            n_grid = int(np.ceil((xs[group[-1]] - x_min)/step)) + 2*npt_star*sub + 2
+            grid = x_min + p[0] + np.arange(n_grid)*step
+            flux_grid = bar_fresnel(grid, X01, X02, fresnel_scale, opacity)
+            kernel = np.zeros(2*npt_star*sub - sub + 1)
+            kernel[::sub] = coeff
+            flux_conv = fftconvolve(flux_grid, kernel[::-1], mode='valid')
+            flux_star[order[group]] = np.interp(xs[group], grid[:len(flux_conv)] - p[0], flux_conv)
+    else:
+        raise ValueError("method must be 'direct' or 'fft'")
+    return flux_star
+
+
+def integrate_exposure(time_model, flux_model, time_obs, exptime, method='mean'):
+    """ Integrates a high resolution model over the exposure of each observed point.
+
+    With method='mean', each point is the mean of the model values strictly inside the exposure
+    window. The integration uses prefix sums of the model flux and locates the exposure
+    boundaries with a binary search, so its cost is O(N_obs + N_model). It assumes a uniform grid.
+
+    With method='trapezoid', the linear interpolation of the model is integrated exactly
+    over the exposure window, using prefix sums of the trapezoids. It is valid for
+    non-uniform grids.
+
+    Parameters:
+        time_model (array): Sorted times of the high resolution model, in seconds.
+        flux_model (array): Model flux for each value of time_model. If a 2D array is given,
+            each row is integrated independently.
+        time_obs (array): Central times of the observed points, in seconds.
+        exptime (int, float): Exposure time, in seconds.
+        method (str): Integration method, 'mean' or 'trapezoid'. Default='mean'
+
+    Returns:
+        flux_inst (array): Integrated flux for each value of time_obs.
+    """
+    flux_model = np.asarray(flux_model, dtype=float)
+    flux_sum = np.zeros(flux_model.shape[:-1] + (flux_model.shape[-1] + 1,))
+    if method == 'mean':
+        np.cumsum(flux_model, axis=-1, out=flux_sum[..., 1:])
+        lower = np.searchsorted(time_model, time_obs - exptime/2., side='right')
+        upper = np.searchsorted(time_model, time_obs + exptime/2., side='left')
+        return (flux_sum[..., upper] - flux_sum[..., lower])/(upper - lower)
+    if method != 'trapezoid':
+        raise ValueError("method must be 'mean' or 'trapezoid'")
+    step = np.diff(time_model)
+    np.cumsum((flux_model[..., 1:] + flux_model[..., :-1])*step/2., axis=-1, out=flux_sum[..., 2:])
+    slope = np.diff(flux_model, axis=-1)/step
+
+    def primitive(time):
+        # integral of the linear interpolation from time_model[0] to time
+        k = np.clip(np.searchsorted(time_model, time, side='right') - 1, 0, len(time_model) - 2)
+        h = time - time_model[k]
+        return flux_sum[..., k+1] + flux_model[..., k]*h + slope[..., k]*h**2/2.
+
+    return (primitive(time_obs + exptime/2.) - primitive(time_obs - exptime/2.))/exptime
+
+
+def adaptive_time_grid(tmin, tmax, fine_ranges, fine_resolution, coarse_resolution):
+    """ Returns a non-uniform time grid, with a fine resolution inside the given ranges
+        and a coarse resolution elsewhere.
+
+    Parameters:
+        tmin, tmax (int, float): Limits of the grid, in seconds.
+        fine_ranges (list): List of (start, end) ranges that need the fine resolution, in seconds.
+        fine_resolution (int, float): Resolution inside the fine ranges, in seconds.
+        coarse_resolution (int, float): Resolution outside the fine ranges, in seconds.
+
+    Returns:
+        time_grid (array): Sorted time grid, from tmin to tmax.
+    """
+    nodes = [tmin]
+    resolutions = []
+    for start, end in sorted(fine_ranges):
+        start, end = max(start, nodes[-1]), min(end, tmax)
+        if end <= start:
+            continue
+        if start > nodes[-1]:
+            nodes.append(start)
+            resolutions.append(coarse_resolution)
+        elif len(resolutions) > 0 and resolutions[-1] == fine_resolution:
+            nodes.pop()
+            resolutions.pop()
+        nodes.append(end)
+        resolutions.append(fine_resolution)
+    if tmax > nodes[-1]:
+        nodes.append(tmax)
+        resolutions.append(coarse_resolution)
+    pieces = [np.linspace(t0, t1, int(np.ceil((t1 - t0)/resolution)) + 1)[:-1]
+              for t0, t1, resolution in zip(nodes[:-1], nodes[1:], resolutions)]
+    return np.concatenate(pieces + [[nodes[-1]]])
+
+
+def model_flux(grid, immersion_time, emersion_time, opacity, npt_star=12, star_method='direct'):
+    """ Returns the high resolution light curve models with fresnel diffraction and with
+        fresnel diffraction plus stellar diameter, one row for each set of parameters.
+
+    Parameters:
+        grid (dict): The model grid, as built by LightCurve.occ_model(). It has the keys
+            'x' (positions of the model, in km), 'vel' (velocity, in km/s), 'd_star' (stellar
+            diameter, in km), 'fresnel_scale' (list with the two fresnel scales, in km) and
+            'table' (list with the FresnelTable of each scale, or None). If it has the key 'step'
+            (local step of the grid, in km), the model is made smooth in the edge times: the fringes
+            that are not resolved by the grid are smoothly replaced by their mean, the geometric shadow,
+            as the exposure would average them, and the stellar diameter model is blended with the
+            point source model in the last stellar diameter of the region where it is computed.
+        immersion_time (int, float, array): Immersion time, in seconds.
+        emersion_time (int, float, array): Emersion time, in seconds.
+        opacity (int, float, array): Opacity. Opaque = 1.0, transparent = 0.0.
+        npt_star (int): Number of subdivisions for computing the star size's effects. Default=12
+        star_method (str): Method used to average the diffraction over the stellar disk,
+            'direct' or 'fft'. Default='direct'
+
+    Returns:
+        flux_fresnel, flux_star (2D-array): Models in the grid.
+    """
+    x = grid['x']
+    vel = grid['vel']
+    d_star = grid['d_star']
+    x01 = np.array(immersion_time, ndmin=1, dtype=float)[:, None]*vel
+    x02 = np.array(emersion_time, ndmin=1, dtype=float)[:, None]*vel
+    opacity = np.array(opacity, ndmin=1, dtype=float)[:, None]
+
+    # Computing fresnel diffraction for the case where the star size is negligenciable
+    flux_fresnel = np.zeros((len(x01), len(x)))
+    for fresnel_scale, table in zip(grid['fresnel_scale'], grid['table']):
+        if grid.get('step') is not None:
+            flux_fresnel += _smooth_fresnel(x, grid['step'], x01, x02, fresnel_scale, opacity, table=table)
+        elif table is None:
+            flux_fresnel += bar_fresnel(x, x01, x02, fresnel_scale, opacity)
+        else:
+            # the table is interpolated with the same weights along a row
+            for i in range(len(x01)):
+                flux_fresnel[i] += bar_fresnel(x, x01[i, 0], x02[i, 0], fresnel_scale, opacity[i, 0], table=table)
+    flux_fresnel /= 2.
+    flux_star = flux_fresnel.copy()
+    if (d_star > 0):
+        # Computing fresnel diffraction for the case where the star size is not negligenciable
+        # Computing stellar diameter only near the immersion or emersion times
+        for i in range(len(x01)):
+            star_diam = np.zeros(len(x), dtype=bool)
+            for x0 in [x01[i, 0], x02[i, 0]]:
+                star_diam[np.searchsorted(x, x0 - 3*d_star, side='right'):
+                          np.searchsorted(x, x0 + 3*d_star, side='left')] = True
+            flux_star_1, flux_star_2 = [star_fresnel(x[star_diam], x01[i, 0], x02[i, 0], fresnel_scale,
+                                                     opacity[i, 0], d_star, npt_star=npt_star, method=star_method)
+                                        for fresnel_scale in grid['fresnel_scale']]
+            flux_star[i, star_diam] = (flux_star_1 + flux_star_2)/2.
+            if grid.get('step') is not None:
+                distance = np.minimum(np.absolute(x[star_diam] - x01[i, 0]), np.absolute(x[star_diam] - x02[i, 0]))
+                weight = np.clip(3 - distance/d_star, 0, 1)
+                weight = weight*weight*(3 - 2*weight)
+                flux_star[i, star_diam] = weight*flux_star[i, star_diam] + (1 - weight)*flux_fresnel[i, star_diam]
+    return flux_fresnel, flux_star
+
+
+def _smooth_fresnel(x, step, x01, x02, fresnel_scale, opacity, table=None):
+    """ Private function that returns the flux of bar_fresnel() with the diffraction fringes that
+        are not resolved by the grid smoothly replaced by the geometric shadow.
+
+    At a distance u from an edge, in units of the fresnel scale, the fringes have a period of
+    about 2/u. Where the local step h of the grid is longer than a quarter of the period, the
+    sampled fringes are aliased and change erratically with the edge times, so the fringes are
+    multiplied by a weight that decreases smoothly from 1 at u*h = 0.5 to 0 at u*h = 1.
+    The Fresnel integrals are computed only where the weight is not zero.
+
+    Parameters:
+        x (array): Positions of the model, in km.
+        step (array): Local step of the grid, in km.
+        x01, x02 (2D-array): Immersion and emersion positions, in km, with shape (n, 1).
+        fresnel_scale (int, float): Fresnel scale, in km.
+        opacity (2D-array): Opacities, with shape (n, 1).
+        table (FresnelTable): If given, the Fresnel integrals are interpolated from the table.
+            Default=None
+
+    Returns:
+        flux (2D-array): The light curves, one row for each set of parameters.
+    """
+    u = np.minimum(np.absolute(x - x01), np.absolute(x - x02))*(step/fresnel_scale**2)
+    weight = np.clip(2 - 2*u, 0, 1)
+    weight = weight*weight*(3 - 2*weight)
+    flux = np.where((x > x01) & (x < x02), (1 - opacity)**2, 1.0)
+    cols = np.flatnonzero(weight.any(axis=0))
+    if table is None:
+        fringes = bar_fresnel(x[cols], x01, x02, fresnel_scale, opacity)
+    else:
+        fringes = np.array([bar_fresnel(x[cols], x01[i, 0], x02[i, 0], fresnel_scale, opacity[i, 0], table=table)
+                            for i in range(len(x01))])
+    flux[:, cols] += weight[:, cols]*(fringes - flux[:, cols])
+    return flux
+
+
+@functools.lru_cache(maxsize=16)
+def edge_profile(fresnel_scale_1, fresnel_scale_2, vel, d_star, exptime, time_resolution, npt_star=12,
+                 star_method='direct'):
+    """ Returns the instrumental light curve of an isolated immersion, as a function of the time
+        relative to the immersion.
+
+    The complex amplitude of a single edge is linear in the opacity, so the instrumental flux
+    of an immersion with opacity "op" is 1 - 2*op*flux_1 + op**2*flux_2. The emersion is the
+    immersion mirrored in time. As in the adaptive grid of model_flux(), the fringes that are not
+    resolved by the time resolution, or that the exposure averages below 1e-3, are replaced by the
+    geometric shadow. So the profiles cover only the extent of the edge, some fresnel scales plus
+    3 stellar diameters and one exposure, and do not depend on the data. Beyond it, flux_1 and flux_2
+    are 0 before the immersion and 1 after it, so the flux is 1 and (1 - op)**2. The profiles are
+    integrated exactly over the exposure and kept in a least recently used cache.
+
+    Parameters:
+        fresnel_scale_1, fresnel_scale_2 (float): Fresnel scales of the bandwidth, in km.
+        vel (float): Event velocity, in km/s.
+        d_star (float): Stellar diameter, in km.
+        exptime (float): Exposure time, in seconds.
+        time_resolution (float): Resolution of the profile, in seconds.
+        npt_star (int): Number of subdivisions for computing the star size's effects. Default=12
+        star_method (str): Method used to average the diffraction over the stellar disk,
+            'direct' or 'fft'. Default='direct'
+
+    Returns:
+        tau, flux_1, flux_2 (array): Time relative to the immersion and the two profiles (read-only).
+    """
+    fresnel_scale = max(fresnel_scale_1, fresnel_scale_2)
+    # at a distance D, the fringes have an amplitude of about sqrt(2)*fresnel_scale/(pi*D) and a period
+    # of about 2*fresnel_scale**2/D, so the exposure averages them below 1e-3 beyond this distance
+    distance = fresnel_scale*np.sqrt(2*np.sqrt(2)*fresnel_scale/(np.pi**2*exptime*vel*1e-3))
+    step = max(time_resolution*vel, fresnel_scale**2/distance)
+    span = exptime + (fresnel_scale**2/step + 3*d_star)/vel
+    tau = np.arange(-span, span + time_resolution, time_resolution)
+    # the model covers the exposures of all the points of the profile
+    time_model = np.arange(-span - exptime, span + exptime + time_resolution, time_resolution)
+    grid = {'x': time_model*vel, 'vel': vel, 'd_star': d_star, 'fresnel_scale': [fresnel_scale_1, fresnel_scale_2],
+            'table': [None, None], 'step': np.full(len(time_model), step)}
+    # an edge evaluated with opacities 1 and -1 gives both profiles
+    flux_star = model_flux(grid, [0.0, 0.0], [np.inf, np.inf], [1.0, -1.0], npt_star=npt_star,
+                           star_method=star_method)[1]
+    flux_pos, flux_neg = integrate_exposure(time_model, flux_star, tau, exptime, method='trapezoid')
+    flux_1 = (flux_neg - flux_pos)/4.
+    flux_2 = (flux_pos + flux_neg)/2. - 1.
+    for profile in [tau, flux_1, flux_2]:
+        profile.flags.writeable = False
+    return tau, flux_1, flux_2
+
+
+def model_inst(grid, immersion_time, emersion_time, opacity, npt_star=12, flux_min=0.0, flux_max=1.0,
+               star_method='direct'):
+    """ Returns the modelled instrumental light flux for one or many sets of parameters.
+
+    Parameters:
+        grid (dict): The model grid, as described in model_flux(). It must also have the keys
+            'time_model' (times of the model, in seconds), 'time_obs' (observed times, in seconds)
+            and 'exptime' (exposure time, in seconds). The key 'integration' gives the method of
+            integrate_exposure(), default is 'mean'. If it has the key 'edge' with the result of
+            edge_profile(), the model is assembled from the cached immersion and emersion profiles
+            plus a flat bottom, which is valid when the occultation is much longer than the edges.
+        immersion_time (int, float, array): Immersion time, in seconds.
+        emersion_time (int, float, array): Emersion time, in seconds.
+        opacity (int, float, array): Opacity. Opaque = 1.0, transparent = 0.0.
+        npt_star (int): Number of subdivisions for computing the star size's effects. Default=12
+        flux_min (int,float): Bottom flux (only object). Default=0.0
+        flux_max (int,float): Base flux (object plus star). Default=1.0
+        star_method (str): Method used to average the diffraction over the stellar disk,
+            'direct' or 'fft'. Default='direct'
+
+    Returns:
+        flux_inst (2D-array): Modelled Instrumental light flux, one row for each set of parameters.
+    """
+    if grid.get('edge') is not None:
+        tau, flux_1, flux_2 = grid['edge']
+        time_obs = grid['time_obs']
+        dt_1 = time_obs - np.array(immersion_time, ndmin=1, dtype=float)[:, None]
+        dt_2 = np.array(emersion_time, ndmin=1, dtype=float)[:, None] - time_obs
+        opacity = np.array(opacity, ndmin=1, dtype=float)[:, None]
+        edges = []
+        for profile in [flux_1, flux_2]:
+            edges.append(np.interp(dt_1.ravel(), tau, profile, left=0., right=1.).reshape(dt_1.shape) +
+                         np.interp(dt_2.ravel(), tau, profile, left=0., right=1.).reshape(dt_2.shape) - 1.)
+        flux_inst = 1. - 2.*opacity*edges[0] + opacity**2*edges[1]
+    else:
+        flux_star = model_flux(grid, immersion_time, emersion_time, opacity, npt_star=npt_star,
+                               star_method=star_method)[1]
+        flux_inst = integrate_exposure(grid['time_model'], flux_star, grid['time_obs'], grid['exptime'],
+                                       method=grid.get('integration', 'mean'))
+    return flux_inst*(flux_max - flux_min) + flux_min
+
+
+def _lcfit_block(grid, flux_obs, sigma, seed, size, immersion_time, emersion_time, opacity, delta_immersion,
+                 delta_emersion, delta_opacity, flux_min=0.0, flux_max=1.0, memory_limit=256, fit_flux=False):
+    """ Evaluates a block of Monte Carlo tests of LightCurve.occ_lcfit() with its own random stream.
+
+    Parameters:
+        grid (dict): The model grid, as described in model_inst().
+        flux_obs (array): Observed flux inside the fitted region.
+        sigma (float): Standard deviation of the observed flux.
+        seed (SeedSequence, int): Seed of the random stream of this block.
+        size (int): Number of tests in this block.
+        immersion_time, emersion_time, opacity (int, float): Central values of the tests.
+        delta_immersion, delta_emersion, delta_opacity (int, float): Intervals of the tests.
+        flux_min (int,float): Bottom flux (only object). Default=0.0
+        flux_max (int,float): Base flux (object plus star). Default=1.0
+        memory_limit (int, float): Approximate memory, in MB, used to evaluate the models at once. Default=256
+        fit_flux (bool): If True, flux_min and flux_max of each test are solved by linear least squares,
+            instead of the given values. Default=False
+
+    Returns:
+        t_i, t_e, opas, f_min, f_max, chi2 (array): The tested parameters and their chi-square.
+    """
+    rng = np.random.default_rng(seed)
+    t_i = immersion_time + delta_immersion*(2*rng.random(size) - 1)
+    t_e = emersion_time + delta_emersion*(2*rng.random(size) - 1)
+    opas = opacity + delta_opacity*(2*rng.random(size) - 1)
+    opas[opas > 1.], opas[opas < 0.] = 1.0, 0.0
+    tflag = np.zeros(size)
+    tflag[t_i > t_e] = t_i[t_i > t_e]
+    t_i[t_i > t_e] = t_e[t_i > t_e]
+    t_e[t_i > t_e] = tflag[t_i > t_e]
+    f_min = flux_min*np.ones(size)
+    f_max = flux_max*np.ones(size)
+    chi2 = 999999*np.ones(size)
+    # about 16 arrays with the size of the model grid are allocated for each test
+    batch = max(1, int(memory_limit*2**20/(16*8*len(grid['time_model']))))
+    for i in range(0, size, batch):
+        model_test = model_inst(grid, t_i[i:i+batch], t_e[i:i+batch], opas[i:i+batch])
+        if fit_flux:
+            # the model is linear in flux_min and flux_max: flux_obs = flux_min + (flux_max - flux_min)*model_test
+            n = model_test.shape[-1]
+            sm, smm = model_test.sum(axis=-1), (model_test**2).sum(axis=-1)
+            sy, smy = flux_obs.sum(), model_test @ flux_obs
+            det = n*smm - sm**2
+            valid = det > 1e-12*n*smm
+            slope = np.where(valid, (n*smy - sm*sy)/np.where(valid, det, 1), 0.0)
+            f_min[i:i+batch] = (sy - slope*sm)/n
+            f_max[i:i+batch] = f_min[i:i+batch] + slope
+        model_test = model_test*(f_max[i:i+batch, None] - f_min[i:i+batch, None]) + f_min[i:i+batch, None]
+        chi2[i:i+batch] = np.sum((flux_obs - model_test)**2, axis=-1)/(sigma**2)
+    return t_i, t_e, opas, f_min, f_max, chi2
+
+
+def _lcfit_blocks(grid, flux_obs, sigma, seeds, sizes, *args):
+    """ Evaluates several blocks of _lcfit_block() in sequence, so the model grid is sent only once
+        to the process that evaluates them.
+
+    Parameters:
+        grid, flux_obs, sigma: As in _lcfit_block().
+        seeds (list): Seeds of the random streams of the blocks.
+        sizes (list): Number of tests in each block.
+        *args: The other parameters of _lcfit_block(), from immersion_time to fit_flux.
+
+    Returns:
+        t_i, t_e, opas, f_min, f_max, chi2 (array): The tested parameters and their chi-square.
+    """
+    blocks = [_lcfit_block(grid, flux_obs, sigma, seed, size, *args) for seed, size in zip(seeds, sizes)]
+    return [np.concatenate(values) for values in zip(*blocks)]
+
+
+class BoxSearch():
+    """ Incremental search of box shaped drops of flux with the highest signal to noise ratio.
+
+    Each box is a set of consecutive points. With prefix sums of the weights and weighted fluxes,
+    the depth and its uncertainty, sqrt(1/W_in + 1/W_out), are computed for all boxes of a given
+    length at once. If all lengths up to maximum_duration fit in the memory budget, all boxes
+    are scored. Otherwise, the lengths are searched in a pyramid of binned levels (lengths of
+    pyramid_base to 2*pyramid_base bins of 2**L points in level L) and the candidates of each
+    level are refined to the resolution of the data.
+
+    The local maxima of the score of each length are kept as candidates. When an event is found,
+    its points are masked, the candidates that overlap it are removed and only the boxes near it
+    are scored again, so each new event costs little more than rescoring the candidates.
+
+    Parameters:
+        time (array): Sorted times, in seconds.
+        flux (array): Flux of each time.
+        dflux (array): Flux uncertainties, used as weights 1/dflux**2. Default=None (equal weights)
+        maximum_duration (int, float): Maximum duration of the box, in seconds.
+            Default=None (time span of the data)
+        pyramid_base (int): Number of bins of the shortest box in each level of the pyramid. Default=16
+        n_candidates (int): Maximum number of candidates kept for each length. Default=100
+    """
+    def __init__(self, time, flux, dflux=None, maximum_duration=None, pyramid_base=16, n_candidates=100):
+        self.time = np.asarray(time, dtype=float)
+        n = len(self.time)
+        if n < 2:
+            raise ValueError('At least two points are necessary to detect an occultation')
+        self.weight = np.ones(n) if dflux is None else 1.0/np.asarray(dflux, dtype=float)**2
+        self.__weighted_flux = self.weight*np.asarray(flux, dtype=float)
+        # the edges of the boxes are midway between consecutive points
+        cycle = np.median(np.diff(self.time))
+        self.edge_time = np.concatenate(([self.time[0] - cycle/2], (self.time[1:] + self.time[:-1])/2,
+                                         [self.time[-1] + cycle/2]))
+        if maximum_duration is None:
+            maximum_duration = self.time[-1] - self.time[0]
+        self.maximum_duration = maximum_duration
+        # maximum number of points inside a box
+        max_length = np.searchsorted(self.edge_time, self.edge_time + maximum_duration, side='right') - np.arange(n + 1)
+        self.max_length = min(max(1, int(np.max(max_length)) - 1), n - 1)
+        self.pyramid_base = pyramid_base
+        self.n_candidates = n_candidates
+        self.exact = n*self.max_length <= 2**24
+        self.events = []
+        self.__update_sums()
+        self.starts, self.ends = self.__search()
+
+    def __update_sums(self):
+        self.__sum_w = np.concatenate(([0.0], np.cumsum(self.weight)))
+        self.__sum_wy = np.concatenate(([0.0], np.cumsum(self.__weighted_flux)))
+
+    def __score(self, start, end):
+        """ Signal to noise ratio of the boxes with the points from start to end-1
+        """
+        n = len(self.time)
+        w_in = self.__sum_w[end] - self.__sum_w[start]
+        w_out = self.__sum_w[-1] - w_in
+        wy_in = self.__sum_wy[end] - self.__sum_wy[start]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            snr = ((self.__sum_wy[-1] - wy_in)/w_out - wy_in/w_in)/np.sqrt(1/w_in + 1/w_out)
+        valid = ((end > start) & (end - start < n) &
+                 (self.edge_time[end] - self.edge_time[start] <= self.maximum_duration))
+        if len(self.events) > 0:
+            # the first and last points of a box can not be masked
+            valid &= (self.weight[np.clip(start, 0, n - 1)] > 0) & (self.weight[np.clip(end - 1, 0, n - 1)] > 0)
+        valid &= np.isfinite(snr)
+        snr[~valid] = -np.inf
+        return snr
+
+    def __search(self, event=None):
+        """ Returns the candidate boxes. If an event (start, end) is given, only the boxes
+            whose candidates could have been suppressed by a box overlapping it are scored.
+        """
+        n = len(self.time)
+        base = self.pyramid_base
+        # blocks of lengths scored at once, with edges at multiples of step
+        if self.exact:
+            blocks = []
+            length = 1
+            while length <= self.max_length:
+                last = min(max(length, int(length*1.1)), self.max_length)
+                blocks.append((1, np.arange(length, last + 1)))
+                length = last + 1
+        else:
+            blocks = [(1, np.arange(1, 2*base))]
+            level = 1
+            while base*2**level <= self.max_length:
+                blocks.append((2**level, np.arange(base, 2*base)))
+                level += 1
+        starts, ends = [np.array([], dtype=int)], [np.array([], dtype=int)]
+        for step, lengths in blocks:
+            window = 2*lengths[-1] + 1
+            if event is None:
+                edges = np.arange(0, n + 1, step)
+            else:
+                lower = max(0, event[0] - window*step)
+                upper = min(n, event[1] + window*step)
+                edges = np.arange(lower - lower % step, upper + 1, step)
+            if lengths[0] >= len(edges):
+                break
+            # the starts are scored in chunks, with the window of the local maxima on each side
+            n_first = len(edges) - lengths[0]
+            chunk = max(window, 2**22//len(lengths))
+            start, end = [], []
+            for i in range(0, n_first, chunk):
+                first = np.arange(max(0, i - window), min(n_first, i + chunk + window))
+                last = first + lengths[:, None]
+                snr = self.__score(edges[first], edges[np.clip(last, 0, len(edges) - 1)])
+                snr[last >= len(edges)] = -np.inf
+                # local maxima of each length inside the chunk, at most n_candidates of them
+                snr[snr < maximum_filter1d(snr, size=window, axis=1, mode='constant', cval=-np.inf)] = -np.inf
+                snr[:, (first < i) | (first >= i + chunk)] = -np.inf
+                if snr.shape[1] > self.n_candidates:
+                    best = np.argpartition(snr, -self.n_candidates, axis=1)[:, -self.n_candidates:]
+                else:
+                    best = np.broadcast_to(np.arange(snr.shape[1]), snr.shape)
+                row = np.broadcast_to(np.arange(len(lengths))[:, None], best.shape)
+                keep = np.isfinite(snr[row, best])
+                start.append(edges[first[best[keep]]])
+                end.append(edges[last[row[keep], best[keep]]])
+            start, end = np.concatenate(start), np.concatenate(end)
+            # refining the edges by one bin at each finer level
+            for sub in 2**np.arange(int(np.log2(step)) - 1, -1, -1):
+                shift = sub*np.array([-1, 0, 1])
+                start_sub = np.clip(start[:, None, None] + shift[None, :, None], 0, n)
+                end_sub = np.clip(end[:, None, None] + shift[None, None, :], 0, n)
+                start_sub, end_sub = [values.reshape(len(start), 9)
+                                      for values in np.broadcast_arrays(start_sub, end_sub)]
+                k = np.argmax(self.__score(start_sub, end_sub), axis=1)
+                start, end = start_sub[np.arange(len(start)), k], end_sub[np.arange(len(start)), k]
+            starts.append(start)
+            ends.append(end)
+        boxes = np.unique(np.vstack([np.concatenate(starts), np.concatenate(ends)]), axis=1)
+        return boxes[0], boxes[1]
+
+    def next_event(self):
+        """ Returns the best box that was not found yet, and masks its points for the next searches.
+
+        Returns:
+            immersion_time, emersion_time (float): Limits of the box, midway between the points
+                inside and outside the box, in seconds.
+            snr (float): Signal to noise ratio of the box, depth/sqrt(1/W_in + 1/W_out).
+            If no box is left, it returns None.
+        """
+        if len(self.starts) == 0:
+            return None
+        snr = self.__score(self.starts, self.ends)
+        k = np.argmax(snr)
+        if not np.isfinite(snr[k]):
+            return None
+        start, end = self.starts[k], self.ends[k]
+        self.weight[start:end] = 0.0
+        self.__weighted_flux[start:end] = 0.0
+        self.__update_sums()
+        self.events.append((start, end))
+        keep = (self.ends <= start) | (self.starts >= end)
+        starts, ends = self.__search(event=(start, end))
+        boxes = np.unique(np.vstack([np.concatenate([self.starts[keep], starts]),
+                                     np.concatenate([self.ends[keep], ends])]), axis=1)
+        self.starts, self.ends = boxes[0], boxes[1]
+        return self.edge_time[start], self.edge_time[end], snr[k]
+
+
+def box_detect(time, flux, dflux=None, maximum_duration=None, pyramid_base=16):
+    """ Finds the single box shaped drop of flux with the highest signal to noise ratio.
+        (See BoxSearch for the method)
+
+    Parameters:
+        time (array): Sorted times, in seconds.
+        flux (array): Flux of each time.
+        dflux (array): Flux uncertainties, used as weights 1/dflux**2. Default=None (equal weights)
+        maximum_duration (int, float): Maximum duration of the box, in seconds.
+            Default=None (time span of the data)
+        pyramid_base (int): Number of bins of the shortest box in each level of the pyramid. Default=16
+
+    Returns:
+        immersion_time, emersion_time (float): Limits of the box, midway between the points
+            inside and outside the box, in seconds.
+        snr (float): Signal to noise ratio of the box, depth/sqrt(1/W_in + 1/W_out).
+    """
+    event = BoxSearch(time, flux, dflux=dflux, maximum_duration=maximum_duration,
+                      pyramid_base=pyramid_base).next_event()
+    if event is None:
+        raise ValueError('No box could be fitted to the data')
+    return event
+
+
+def bin_lightcurve(time, flux, factor):
+    """ Bins a light curve, averaging each group of factor consecutive points.
+        (The last group may have less points)
+
+    Parameters:
+        time (array): Times of the light curve.
+        flux (array): Flux of the light curve.
+        factor (int): Number of points of each bin.
+
+    Returns:
+        time_bin, flux_bin (array): Mean time and flux of each bin.
+    """
+    starts = np.arange(0, len(time), factor)
+    counts = np.diff(np.append(starts, len(time)))
+    return np.add.reduceat(time, starts)/counts, np.add.reduceat(flux, starts)/counts
+
+
+def read_lightcurve(file, usecols=None):
+    """ Reads the time, flux and flux error of a light curve file in a single pass.
+
+    Parameters:
+        file (str): Name of the file. The format is given by the extension:
+            '.npy': 2D array with one column per quantity, as in the text files (memory-mapped).
+            '.npz': arrays named 'time', 'flux' and 'dflux' (as saved by LightCurve.to_file),
+                or the arrays in the order they were saved.
+            '.fits', '.fit', '.fts': binary table with the columns 'time', 'flux' and 'dflux',
+                or the columns in the order of the table.
+            Any other extension is read as a text file with the columns separated by spaces.
+        usecols (int, tuple, array): Which columns to read, with the first being the time,
+            the second the flux and third the flux error [optional].
+            Default: the first 3 columns if they exist, else the first 2.
+
+    Returns:
+        time, flux (array): Time and flux of the light curve.
+        dflux (array): Flux error, or None if the file has only 2 columns.
+        tref (Time): Instant of reference of the time saved in the binary files, or None.
+    """
+    if not os.path.isfile(file):
+        raise ValueError('{} not found'.format(file))
+    if usecols is not None and len(usecols) not in [2, 3]:
+        raise ValueError('usecols should have 2 or 3 values')
+    ext = os.path.splitext(file)[1].lower()
+    tref = None
+    if ext in ['.npy', '.npz', '.fits', '.fit', '.fts']:
+        if ext == '.npy':
+            data = np.load(file, mmap_mode='r')
+            if data.ndim != 2:
+                raise ValueError('{} must have a 2D array'.format(file))
+            columns = [data[:, i] for i in range(data.shape[1])]
+            names = []
+        elif ext == '.npz':
+            data = np.load(file)
+            names = list(data.files)
+            columns = [data[name] for name in names]
+            if 'tref' in names:
+                tref = Time(str(data['tref']))
+        else:
+            from astropy.io import fits
+            with fits.open(file, memmap=True) as hdul:
+                table = hdul[1].data
+                names = [name.lower() for name in table.names]
+                columns = [np.array(table[name], dtype=float) for name in table.names]
+                if 'TREF' in hdul[1].header:
+                    tref = Time(hdul[1].header['TREF'])
+        if usecols is None and 'time' in names and 'flux' in names:
+            usecols = [names.index(name) for name in ['time', 'flux', 'dflux'] if name in names]
+        elif usecols is None:
+            usecols = list(range(min(len(columns), 3)))
+        if len(columns) < 2 or max(usecols) >= len(columns):
+            raise ValueError('Input file must have 2 or 3 columns')
+        data = [columns[i] for i in usecols]
+    else:
+        if usecols is None:
+            with open(file) as f:
+                ncols = 0
+                for line in f:
+                    line = line.split('#')[0].split()
+                    if line:
+                        ncols = len(line)
+                        break
+            if ncols < 2:
+                raise ValueError('Input file must have 2 or 3 columns')
+            usecols = [0, 1, 2][:min(ncols, 3)]
+        data = np.loadtxt(file, usecols=usecols, unpack=True, ndmin=2)
+    time, flux = data[0], data[1]
+    dflux = data[2] if len(data) == 3 else None
+    return time, flux, dflux, tref
+
+
+class StreamDetector():
+    """ Real time detection of occultations in a light curve received in chunks.
+
+    The baseline mean and variance are updated with exponential weights for each sample outside
+    an event, so the cost per sample is constant. An immersion is flagged when n_confirm consecutive
+    samples are below the baseline by more than threshold standard deviations, and the emersion when
+    n_confirm consecutive samples are back above that level. The samples are kept, so the light curve
+    can be handed to a LightCurve object for the final fit.
+
+    Parameters:
+        tref (Time,str,float): Instant of reference of the times. It can be in Julian Date, string
+            in ISO format or Time object.
+        exptime (int,float): The exposure time of the observation, in seconds.
+        baseline_window (int): Number of samples of the memory of the baseline. Default=100
+        threshold (int,float): Drop, in standard deviations of the baseline, that flags an event. Default=3
+        n_confirm (int): Number of consecutive samples needed to confirm an immersion or emersion. Default=2
+        snr_limit (int,float): Minimum SNR of the events reported at the emersion. Default=5
+        keep_data (bool): If True, the samples are kept to create a LightCurve. Default=True
+
+    Example:
+        >>> stream = StreamDetector(tref='2020-06-01 00:00', exptime=0.1)
+        >>> for time, flux in camera:
+        ...     for candidate in stream.update(time, flux):
+        ...         print(candidate)
+        >>> lc = stream.to_lightcurve(name='live')
+        >>> event = stream.events[0]
+        >>> lc.occ_lcfit(immersion_time=event['immersion_time'], emersion_time=event['emersion_time'],
+        ...              delta_t=event['time_err']*5)
+    """
+    def __init__(self, tref, exptime, baseline_window=100, threshold=3.0, n_confirm=2, snr_limit=5.0,
+                 keep_data=True):
+        if type(tref) in [int, float]:
+            tref = Time(tref, format='jd')
+        self.tref = Time(tref)
+        if exptime <= 0:
+            raise ValueError('Exposure time can not be zero or negative')
+        if baseline_window < 2 or n_confirm < 1:
+            raise ValueError('baseline_window must be at least 2 and n_confirm at least 1')
+        self.exptime = exptime
+        self.baseline_window = baseline_window
+        self.threshold = threshold
+        self.n_confirm = n_confirm
+        self.snr_limit = snr_limit
+        self.keep_data = keep_data
+        self.events = []
+        self.n_samples = 0
+        self.__alpha = 1.0/baseline_window
+        self.__mean = 0.0
+        self.__var = 0.0
+        self.__n_baseline = 0
+        self.__last_time = None
+        self.__in_event = False
+        self.__pending = []
+        self.__event = None
+        self.__chunks = []
+
+    @property
+    def baseline(self):
+        """ Current mean and standard deviation of the baseline """
+        return self.__mean, np.sqrt(self.__var)
+
+    def __baseline_update(self, flux):
+        # cumulative mean during the first samples, exponential afterwards
+        self.__n_baseline += 1
+        alpha = max(self.__alpha, 1.0/self.__n_baseline)
+        delta = flux - self.__mean
+        self.__mean += alpha*delta
+        self.__var = (1 - alpha)*(self.__var + alpha*delta**2)
+
+    def __snr(self, flux_sum, n):
+        """ SNR of the mean of n samples with respect to the baseline """
+        n_base = min(self.__n_baseline, 2*self.baseline_window)
+        return (self.__mean - flux_sum/n)/(np.sqrt(self.__var)*np.sqrt(1.0/n + 1.0/n_base))
+
+    def update(self, time, flux):
+        """ Processes a chunk of samples.
+
+        Parameters:
+            time (int, float, array): Times of the samples, in seconds relative to tref.
+            flux (int, float, array): Flux of the samples.
+
+        Returns:
+            candidates (list): Dictionaries with the immersions ('type': 'immersion', 'immersion_time',
+                'snr') and the events closed at the emersion ('type': 'emersion', 'immersion_time',
+                'emersion_time', 'time_err', 'depth', 'snr', 'n_points') flagged in this chunk.
+                The events with SNR above snr_limit are also kept in the events attribute.
+        """
+        time = np.array(time, ndmin=1, dtype=float)
+        flux = np.array(flux, ndmin=1, dtype=float)
+        if len(time) != len(flux):
+            raise ValueError('time and flux must have the same length')
+        if self.keep_data:
+            self.__chunks.append((time, flux))
+        candidates = []
+        for t, f in zip(time, flux):
+            previous, self.__last_time = self.__last_time, t
+            self.n_samples += 1
+            if self.__n_baseline < self.baseline_window:
+                self.__baseline_update(f)
+                continue
+            sigma = np.sqrt(self.__var)
+            low = f < self.__mean - self.threshold*sigma
+            if not self.__in_event:
+                if not low:
+                    for pending in self.__pending:
+                        self.__baseline_update(pending[1])
+                    self.__pending = []
+                    self.__baseline_update(f)
+                    continue
+                if len(self.__pending) == 0:
+                    # the immersion is midway between the last baseline sample and the first low sample
+                    start = t if previous is None else (previous + t)/2
+                    self.__event = {'immersion_time': start, 'flux_sum': 0.0, 'n_points': 0, 'step': t - start}
+                self.__pending.append((t, f))
+                if len(self.__pending) == self.n_confirm:
+                    self.__in_event = True
+                    for pending in self.__pending:
+                        self.__event['flux_sum'] += pending[1]
+                        self.__event['n_points'] += 1
+                    self.__pending = []
+                    candidates.append({'type': 'immersion', 'immersion_time': self.__event['immersion_time'],
+                                       'snr': self.__snr(self.__event['flux_sum'], self.__event['n_points'])})
+            elif low:
+                for pending in self.__pending:
+                    self.__event['flux_sum'] += pending[1]
+                    self.__event['n_points'] += 1
+                self.__pending = []
+                self.__event['flux_sum'] += f
+                self.__event['n_points'] += 1
+            else:
+                if len(self.__pending) == 0:
+                    # the emersion is midway between the last low sample and the first recovered sample
+                    self.__event['emersion_time'] = (previous + t)/2
+                self.__pending.append((t, f))
+                if len(self.__pending) == self.n_confirm:
+                    candidates.append(self.__close_event())
+        return candidates
+
+    def __close_event(self):
+        event = self.__event
+        snr = self.__snr(event['flux_sum'], event['n_points'])
+        output = {'type': 'emersion', 'immersion_time': event['immersion_time'],
+                  'emersion_time': event['emersion_time'], 'time_err': event['step'],
+                  'depth': self.__mean - event['flux_sum']/event['n_points'], 'snr': snr,
+                  'n_points': event['n_points']}
+        if snr >= self.snr_limit:
+            self.events.append(output)
+        for pending in self.__pending:
+            self.__baseline_update(pending[1])
+        self.__pending = []
+        self.__in_event = False
+        self.__event = None
+        return output
+
+    def to_lightcurve(self, name, **kwargs):
+        """ Returns a LightCurve with the samples received so far.
+
+        Parameters:
+            name (str): The name of the LightCurve.
+            **kwargs: Other parameters of LightCurve, like vel, dist and d_star.
+
+        Returns:
+            lc (LightCurve): The light curve, with the tref and exptime of the stream.
+        """
+        if not self.keep_data:
+            raise ValueError('The samples were not kept (keep_data=False)')
+        if len(self.__chunks) == 0:
+            raise ValueError('No samples were received')
+        time = np.concatenate([chunk[0] for chunk in self.__chunks])
+        flux = np.concatenate([chunk[1] for chunk in self.__chunks])
+        return LightCurve(name=name, time=time, flux=flux, exptime=self.exptime, tref=self.tref, **kwargs)
+
+
 class LightCurve():
     __names = []
 
@@ -114,13 +1143,17 @@ class LightCurve():
         """
         allowed_kwargs = ['emersion', 'emersion_err', 'immersion', 'immersion_err', 'initial_time', 'end_time',
                           'file', 'time', 'flux', 'exptime', 'central_bandpass', 'delta_bandpass', 'tref', 'dflux',
-                          'usecols', 'dist', 'vel', 'd_star']
+                          'usecols', 'dist', 'vel', 'd_star', 'scratch']
         input_tests.check_kwargs(kwargs, allowed_kwargs=allowed_kwargs)
         input_done = False
+        self.__model_cache = OrderedDict()
+        self.__model_cache_info = {'hits': 0, 'misses': 0, 'maxsize': 16}
         self.dflux = None
+        self.scratch = None
         self.__name = name
         self.flux = None
         self.time_model = None
+        self.__time_sec = None
         if self.__name in self.__names:
             raise ValueError('name {} already defined for another LightCurve object. Please choose a different one.'.
                              format(self.__name))
@@ -146,6 +1179,8 @@ class LightCurve():
         self.lambda_0 = kwargs.get('central_bandpass', 0.70)
         self.delta_lambda = kwargs.get('delta_bandpass', 0.30)
         self.dt = 0.0
+        self.fresnel_table = None
+        self.window = None
         self.__names.append(self.__name)
 
     @property
@@ -186,6 +1221,8 @@ class LightCurve():
                 self._tref = Time(value)
             except ValueError:
                 raise ValueError('{} is not a valid time format accepted by tref'.format(value))
+            self.__time_sec = None
+            self.__model_cache.clear()
 
     @property
     def immersion(self):
@@ -284,10 +1321,23 @@ class LightCurve():
 
     @property
     def time(self):
-        try:
-            return (self._time - self.tref).sec
-        except:
-            raise AttributeError("'LightCurve' object has no attribute 'time'")
+        """ Instants of the observations, in seconds relative to tref.
+
+        It is computed from the Time object only once and kept as a read-only float64 array,
+        which is recomputed only when tref or the data change. With a scratch directory, the
+        array is memory-mapped and filled in blocks, so it is not held in RAM.
+        """
+        if self.__time_sec is None:
+            try:
+                time_sec = self.__new_array()
+                block = 2**20
+                for i in range(0, len(time_sec), block):
+                    time_sec[i:i+block] = (self._time[i:i+block] - self.tref).sec
+            except:
+                raise AttributeError("'LightCurve' object has no attribute 'time'")
+            time_sec.flags.writeable = False
+            self.__time_sec = time_sec
+        return self.__time_sec
 
     def check_names(self):
         return self.__names
@@ -298,7 +1348,8 @@ class LightCurve():
         Parameters:
             exptime (int,float): The exposure time of the observation, in seconds (required)
             file (str): a file with the time and flux in the first and second columns, respectively.
-                A third column with error in flux can also be given.
+                A third column with error in flux can also be given. Binary '.npy', '.npz'
+                and FITS files are also accepted (see read_lightcurve()).
             time: if file not given, time must be a list of times, in seconds from tref, or Julian Date,
                 or a Time object.
             flux: if file not given, flux must be a list of fluxes. It must have the same lenght as time.
@@ -308,38 +1359,27 @@ class LightCurve():
                 or Time object.
             usecols (int, tuple, array): Which columns to read, with the
                     first being the time, the seconds the flux and third the flux error [optional].
+            scratch (str): Directory where the model, the normalized flux and the times in seconds
+                (see time) are kept as temporary memory-mapped files, instead of in RAM. Default=None
+        The flux and dflux arrays are not copied if the times are already sorted, so memory-mapped
+        flux and dflux (e.g. '.npy' files or np.memmap) are kept on disk. The times are always
+        converted to a Time object, which is kept in RAM.
         Kwargs:
             vel (int,float):  velocity in km/s
             dist (int,float): object distance in AU
             d_star (float):   star diameter, in km
         """
         input_done = False
-        usecols = None
-        if 'usecols' in kwargs:
-            usecols = kwargs['usecols']
+        file_tref = None
+        if 'scratch' in kwargs:
+            if kwargs['scratch'] is not None and not os.path.isdir(kwargs['scratch']):
+                raise ValueError('{} is not a directory'.format(kwargs['scratch']))
+            self.scratch = kwargs['scratch']
         if 'file' in kwargs:
-            if not os.path.isfile(kwargs['file']):
-                raise ValueError('{} not found'.format(kwargs['file']))
-            if usecols is not None:
-                if len(usecols) == 2:
-                    time, self.flux = np.loadtxt(kwargs['file'], usecols=usecols, unpack=True)
-                elif len(usecols) == 3:
-                    time, self.flux, self.dflux = np.loadtxt(kwargs['file'], usecols=usecols, unpack=True)
-                else:
-                    raise ValueError('usecols should have 2 or 3 values')
-            else:
-                try:
-                    time, self.flux, self.dflux = np.loadtxt(kwargs['file'], usecols=[0, 1, 2], unpack=True)
-                except:
-                    pass
-                try:
-                    time, self.flux = np.loadtxt(kwargs['file'], usecols=[0, 1], unpack=True)
-                except:
-                    pass
-            if hasattr(self, 'flux'):
-                self.flux_obs = self.flux
-            if not hasattr(self, 'flux_obs'):
-                raise ValueError('Input file must have 2 or 3 columns')
+            time, self.flux, dflux, file_tref = read_lightcurve(kwargs['file'], usecols=kwargs.get('usecols'))
+            if dflux is not None:
+                self.dflux = dflux
+            self.flux_obs = self.flux
             input_done = True
         if 'time' in kwargs and 'flux' in kwargs:
             if input_done:
@@ -367,11 +1407,13 @@ class LightCurve():
             self.set_star_diam(d_star=kwargs['d_star'])
         if 'tref' in kwargs:
             self.tref = kwargs['tref']
+        elif file_tref is not None and not hasattr(self, 'tref'):
+            self.tref = file_tref
         if 'time' in locals():
             if type(time) == Time:
                 if not hasattr(self, 'tref'):
                     self.tref = Time(time[0].iso.split(' ')[0] + ' 00:00:00.000')
-            elif all(time > 2400000):
+            elif np.all(np.asarray(time) > 2400000):
                 time = Time(time, format='jd')
                 if not hasattr(self, 'tref'):
                     self.tref = Time(time[0].iso.split(' ')[0] + ' 00:00:00.000')
@@ -379,16 +1421,25 @@ class LightCurve():
                 raise ValueError('tref must be given')
             else:
                 time = self.tref + time*u.s
-            order = np.argsort(time)
-            self._time = time[order]
-            self.model = np.ones(len(time))
-            self.flux = self.flux[order]
-            self.flux_obs = self.flux
+            self.flux = np.asarray(self.flux)
             if self.dflux is not None:
-                self.dflux = self.dflux[order]
-            self.initial_time = np.min(time)
-            self.end_time = np.max(time)
-            self.cycle = np.median(time[1:] - time[:-1]).sec
+                self.dflux = np.asarray(self.dflux)
+            cycles = (time[1:] - time[:-1]).sec
+            if np.any(cycles < 0):
+                order = np.argsort(time)
+                time = time[order]
+                self.flux = self.flux[order]
+                if self.dflux is not None:
+                    self.dflux = self.dflux[order]
+                cycles = (time[1:] - time[:-1]).sec
+            self._time = time
+            self.__time_sec = None
+            self.__model_cache.clear()
+            self.model = self.__new_array(fill=1.0)
+            self.flux_obs = self.flux
+            self.initial_time = time[0]
+            self.end_time = time[-1]
+            self.cycle = np.median(cycles)
             if self.cycle < self.exptime:
                 warnings.warn('Exposure time ({:0.4f} seconds) higher than Cycle time ({:0.4f} seconds)'.
                               format(self.exptime, self.cycle))
@@ -410,6 +1461,7 @@ class LightCurve():
         if exptime <= 0:
             raise ValueError('Exposure time can not be zero or negative')
         self.exptime = exptime
+        self.__model_cache.clear()
         try:
             if self.cycle < self.exptime:
                 warnings.warn('Exposure time ({:0.4f} seconds) higher than Cycle time ({:0.4f} seconds)'.
@@ -430,6 +1482,7 @@ class LightCurve():
         else:
             raise TypeError('vel must be an integer, a float or an Astropy Unit object')
         self.vel = np.absolute(vel)
+        self.__model_cache.clear()
 
     def set_dist(self, dist):
         """ Sets the object distance
@@ -444,6 +1497,7 @@ class LightCurve():
         else:
             raise TypeError('dist must be an integer, a float or an Astropy Unit object')
         self.dist = dist
+        self.__model_cache.clear()
 
     def set_star_diam(self, d_star):
         """ Sets the star diameter
@@ -458,6 +1512,7 @@ class LightCurve():
         else:
             raise TypeError('d_star must be an integer, a float or an Astropy Unit object')
         self.d_star = d_star
+        self.__model_cache.clear()
 
     @deprecated_alias(lambda_0='central_bandpass', delta_lambda='delta_bandpass')  # remove this line for v1.0
     def set_filter(self, central_bandpass, delta_bandpass):
@@ -481,6 +1536,120 @@ class LightCurve():
         else:
             raise TypeError('delta_bandpass must be a float or an Astropy Unit object')
         self.delta_lambda = delta_bandpass
+        self.__model_cache.clear()
+
+    def set_fresnel_table(self, step=0.005, limit=100.0):
+        """ Sets the tabulated Fresnel integrals used by occ_model() and occ_lcfit()
+
+        The tables are shared by all the LightCurve objects and the last 16 are kept in memory.
+        The table step is adjusted to divide the model resolution, so the interpolation
+        weights are the same for all the model points.
+
+        Parameters:
+            step (int, float): Maximum step of the table, in units of the Fresnel scale.
+                If None, the Fresnel integrals are computed directly. Default=0.005
+            limit (int, float): Maximum distance to immersion or emersion covered by the table,
+                in units of the Fresnel scale. Default=100
+        """
+        self.__model_cache.clear()
+        if step is None:
+            self.fresnel_table = None
+            return
+        if step <= 0 or limit <= 0:
+            raise ValueError('step and limit must be positive')
+        self.fresnel_table = {'step': step, 'limit': limit}
+
+    def set_model_cache(self, maxsize=16):
+        """ Sets the number of models kept in memory by occ_model()
+
+        The models are kept by their parameters, the mask and the physical parameters (velocity,
+        distance, star diameter, exposure time, filter and Fresnel table), and the least recently
+        used is discarded. The cache is cleared when the physical parameters or the data are changed
+        by the set methods or tref, and when this method is called.
+
+        Parameters:
+            maxsize (int): Maximum number of models. If 0, the models are not kept. Default=16
+        """
+        if maxsize < 0:
+            raise ValueError('maxsize must be a positive integer or zero')
+        self.__model_cache.clear()
+        self.__model_cache_info = {'hits': 0, 'misses': 0, 'maxsize': int(maxsize)}
+
+    def model_cache_info(self):
+        """ Returns the statistics of the models kept by occ_model()
+
+        Returns:
+            info (dict): Dictionary with the number of 'hits' and 'misses' since set_model_cache()
+                or the creation of the object, the 'maxsize' and the number of models kept ('currsize').
+        """
+        return dict(self.__model_cache_info, currsize=len(self.__model_cache))
+
+    def set_window(self, tmin=None, tmax=None, decimation=None, margin=None):
+        """ Sets a window of the light curve for long, high-cadence observations.
+
+        If tmin and tmax are not given, the occultation is located on a copy of the light curve
+        binned by "decimation" points and the window is the event plus a margin on each side.
+        Then, occ_detect() searches only inside the window, occ_lcfit() fits and models only
+        inside the window, to_file() saves only the window and normalize() fits the baseline
+        on the light curve binned by "decimation" points. The window is saved in the attribute
+        "window". To remove it, set lc.window = None.
+
+        Parameters:
+            tmin (int, float): Start of the window, in seconds. Default=None
+            tmax (int, float): End of the window, in seconds. Default=None
+            decimation (int): Number of points of each bin to locate the event and to normalize.
+                Default=None (bins with 100000 points at most)
+            margin (int, float): Time added before the immersion and after the emersion located
+                on the binned light curve, in seconds. Default=twice the occultation duration,
+                and at least 10 bins.
+        """
+        if not hasattr(self, 'flux'):
+            raise ValueError('A window is only possible when a LightCurve is instatiated with time and flux.')
+        if decimation is None:
+            decimation = int(np.ceil(len(self.time)/100000))
+        if decimation < 1:
+            raise ValueError('decimation must be a positive integer')
+        if tmin is None or tmax is None:
+            time_bin, flux_bin = bin_lightcurve(self.time, self.flux, decimation)
+            immersion_time, emersion_time, _ = box_detect(time_bin, flux_bin)
+            if margin is None:
+                margin = max(2*(emersion_time - immersion_time), 10*decimation*self.cycle)
+            if tmin is None:
+                tmin = max(immersion_time - margin, self.time[0])
+            if tmax is None:
+                tmax = min(emersion_time + margin, self.time[-1])
+        if tmax <= tmin:
+            raise ValueError('tmax must be greater than tmin')
+        self.window = {'tmin': tmin, 'tmax': tmax, 'decimation': int(decimation)}
+
+    def __new_array(self, fill=None):
+        """ Private function that returns a float64 array with the length of the light curve,
+            memory-mapped to a temporary file in the scratch directory if it was given
+        """
+        if self.scratch is None:
+            array = np.empty(len(self._time))
+        else:
+            array = np.memmap(tempfile.TemporaryFile(dir=self.scratch), dtype=np.float64, mode='w+',
+                              shape=(len(self._time),))
+        if fill is not None:
+            array[:] = fill
+        return array
+
+    def __window_mask(self):
+        """ Private function that returns the mask of the points inside the window
+        """
+        if self.window is None:
+            return np.ones(len(self.time), dtype=bool)
+        return (self.time >= self.window['tmin']) & (self.time <= self.window['tmax'])
+
+    def __fresnel_table(self, fresnel_scale, x):
+        """ Private function that returns the Fresnel table for the regular model grid x, in km.
+        """
+        if self.fresnel_table is None or len(x) < 2:
+            return None
+        du = (x[-1] - x[0])/((len(x) - 1)*fresnel_scale)
+        step = du/np.ceil(du/self.fresnel_table['step'])
+        return fresnel_table(step, self.fresnel_table['limit'])
 
     def calc_magnitude_drop(self, mag_star, mag_obj):
         """ Determines the magnitude drop of the occultation
@@ -501,7 +1670,7 @@ class LightCurve():
         self.bottom_flux = bottom_flux
         return
 
-    def normalize(self, poly_deg=None, mask=None, flux_min=0.0, flux_max=1.0, plot=False):
+    def normalize(self, poly_deg=None, mask=None, flux_min=0.0, flux_max=1.0, plot=False, method='lsq'):
         """ Returns the fresnel scale.
 
         Parameters:
@@ -510,9 +1679,15 @@ class LightCurve():
             flux_min (int,float): event flux to be setted as 0.0
             flux_max (int,float): baseline flux to be setted as 1.0
             plot (Bollean): If True plot the steps for visual aid
+            method (str): 'lsq' fits all the degrees with a single QR factorization (fit_pol_nested()),
+                'odr' fits each degree with scipy ODR (fit_pol()). Default='lsq'
+        If a window was set by set_window(), the polynom is fitted to the baseline binned
+        by the decimation of the window.
         """
         # Create a mask where the polynomial fit will be done
-        if not all(self.flux):
+        if method not in ['lsq', 'odr']:
+            raise ValueError("method must be 'lsq' or 'odr'")
+        if self.flux is None or not np.all(self.flux):
             raise ValueError('Normalization is only possible when a LightCurve is instatiated with time and flux.')
         self.reset_flux()
         lc_flux = (self.flux - flux_min)/(flux_max-flux_min)
@@ -523,48 +1698,54 @@ class LightCurve():
             chord = preliminar_occ['occultation_duration']
             mask = np.invert((self.time > tmin-(chord/2)) & (self.time < tmax+(chord/2)))
         norm_time = (self.time - self.time.min())/(self.time.max()-self.time.min())
+        fit_time, fit_flux = norm_time[mask], lc_flux[mask]
+        if self.window is not None and self.window['decimation'] > 1:
+            fit_time, fit_flux = bin_lightcurve(fit_time, fit_flux, self.window['decimation'])
+        max_deg = poly_deg if poly_deg is not None else min(9, len(fit_time) - 1)
+        if method == 'lsq':
+            fit = fit_pol_nested(fit_time, fit_flux, max_deg).__getitem__
+        else:
+            def fit(deg):
+                return fit_pol(fit_time, fit_flux, deg)[0]
+
         if poly_deg is not None:
             n = poly_deg
-            p, err = fit_pol(norm_time[mask], lc_flux[mask], n)
-            flux_poly_model = np.zeros(len(norm_time))
-            for ii in np.arange(n+1):
-                flux_poly_model = flux_poly_model + p[ii]*(norm_time**(n-ii))
+            p = fit(n)
+            flux_poly_model = np.polyval(p, norm_time)
             if plot:
-                pl.plot(norm_time[mask], lc_flux[mask], 'k.-')
-                pl.plot(norm_time[mask], flux_poly_model[mask], 'r-')
+                pl.plot(fit_time, fit_flux, 'k.-')
+                pl.plot(fit_time, np.polyval(p, fit_time), 'r-')
                 pl.title('Polynomial degree = {}'.format(n), fontsize=15)
                 pl.show()
         if poly_deg is None:
             n = 0
-            p, err = fit_pol(norm_time[mask], lc_flux[mask], n)
-            flux_poly_model = np.zeros(len(norm_time))
-            for ii in np.arange(n+1):
-                flux_poly_model += p[ii]*(norm_time**(n-ii))
+            p = fit(n)
+            fit_model = np.polyval(p, fit_time)
             if plot:
-                pl.plot(norm_time[mask], lc_flux[mask], 'k.-')
-                pl.plot(norm_time[mask], flux_poly_model[mask], 'r-')
+                pl.plot(fit_time, fit_flux, 'k.-')
+                pl.plot(fit_time, fit_model, 'r-')
                 pl.title('Polynomial degree = {}'.format(n), fontsize=15)
                 pl.show()
-            for nn in np.arange(1, 10):
-                p, err = fit_pol(norm_time[mask], lc_flux[mask], nn)
-                flux_poly_model_new = np.zeros(len(norm_time))
-                for ii in np.arange(nn+1):
-                    flux_poly_model_new += p[ii]*(norm_time**(nn-ii))
-                F = np.var(flux_poly_model[mask]-lc_flux[mask])/np.var(flux_poly_model_new[mask]-lc_flux[mask])
+            for nn in np.arange(1, max_deg + 1):
+                p_new = fit(nn)
+                fit_model_new = np.polyval(p_new, fit_time)
+                F = np.var(fit_model-fit_flux)/np.var(fit_model_new-fit_flux)
                 if F > 1.05:
-                    flux_poly_model = flux_poly_model_new.copy()
+                    p, fit_model = p_new, fit_model_new
                     n = nn
                     if plot:
-                        pl.plot(norm_time[mask], lc_flux[mask], 'k.-')
-                        pl.plot(norm_time[mask], flux_poly_model[mask], 'r-')
+                        pl.plot(fit_time, fit_flux, 'k.-')
+                        pl.plot(fit_time, fit_model, 'r-')
                         pl.title('Polynomial degree = {}'.format(nn), fontsize=15)
                         pl.show()
                 else:
                     print('Normalization using a {} degree polynom'.format(n))
                     print('There is no improvement with a {} degree polynom'.format(n+1))
                     break
-        self.flux = lc_flux/flux_poly_model
-        self.normalizer_flux = flux_poly_model
+            flux_poly_model = np.polyval(p, norm_time)
+        self.flux = self.__new_array()
+        np.divide(lc_flux, flux_poly_model, out=self.flux)
+        self.normalizer_flux = self.__new_array(fill=flux_poly_model)
         self.normalizer_mask = mask
         return
 
@@ -578,7 +1759,7 @@ class LightCurve():
         return
 
     def occ_model(self, immersion_time, emersion_time, opacity, mask, npt_star=12,
-                  time_resolution_factor=10, flux_min=0, flux_max=1):
+                  time_resolution_factor=10, flux_min=0, flux_max=1, star_method='direct', adaptive_grid=False):
         """ Returns the modelled light curve considering fresnel difraction, star diameter and intrumental response.
 
         Parameters:
@@ -591,60 +1772,61 @@ class LightCurve():
                 Default=10*fresnel scale.
             flux_min (int,float): Bottom flux (only object). Default=0.0
             flux_max (int,float): Base flux (object plus star). Default=1.0
+            star_method (str): Method used to average the diffraction over the stellar disk.
+                'direct' evaluates the 2*npt_star points of the disk for each model point,
+                'fft' convolves the diffraction profile with the disk, within 1e-3 of 'direct'
+                (see star_fresnel()). Default='direct'
+            adaptive_grid (bool): If True, the model is computed with the fine resolution only near the
+                immersion and emersion, with a coarse resolution elsewhere, and integrated exactly over
+                the non-uniform grid. The fringes that the grid does not resolve are replaced by the
+                geometric shadow, so the model is smooth in the immersion and emersion times. It agrees with
+                a model of 20 times finer resolution within about 5e-3 of the flux drop, while the uniform
+                model with the default resolution may differ from it by up to 2e-2. Default=False
+        The last models are kept in memory and are not computed again (see set_model_cache()).
         """
-        # Computing the fresnel scale
-        lamb = self.lambda_0*u.micrometer.to('km')
-        dlamb = self.delta_lambda*u.micrometer.to('km')
-        dist = self.dist*u.au.to('km')
-        vel = np.absolute(self.vel)
-        time_obs = self.time[mask]
-        fresnel_scale_1 = calc_fresnel(dist, lamb-dlamb/2.0)
-        fresnel_scale_2 = calc_fresnel(dist, lamb+dlamb/2.0)
-        fresnel_scale = (fresnel_scale_1 + fresnel_scale_2)/2.0
-        time_resolution = (np.min([fresnel_scale/vel, self.exptime]))/time_resolution_factor
-
-        # Creating a high resolution curve to compute fresnel difraction, stellar diameter and instrumental integration
-        time_model = np.arange(time_obs.min()-5*self.exptime, time_obs.max()+5*self.exptime, time_resolution)
-
-        # Changing X: time (s) to distances in the sky plane (km), considering the tangential velocity (vel in km/s)
-        x = time_model*vel
-        x01 = immersion_time*vel
-        x02 = emersion_time*vel
-
-        # Computing fresnel diffraction for the case where the star size is negligenciable
-        flux_fresnel_1 = self.__bar_fresnel(x, x01, x02, fresnel_scale_1, opacity)
-        flux_fresnel_2 = self.__bar_fresnel(x, x01, x02, fresnel_scale_2, opacity)
-        flux_fresnel = (flux_fresnel_1 + flux_fresnel_2)/2.
-        flux_star = flux_fresnel.copy()
-        if (self.d_star > 0):
-            # Computing fresnel diffraction for the case where the star size is not negligenciable
-            resolucao = self.d_star/npt_star
-            flux_star_1 = np.zeros(len(time_model))
-            flux_star_2 = np.zeros(len(time_model))
-            # Computing stellar diameter only near the immersion or emersion times
-            star_diam = (np.absolute(x - x01) < 3*self.d_star) + (np.absolute(x - x02) < 3*self.d_star)
-            p = np.arange(-npt_star, npt_star)*resolucao
-            coeff = np.sqrt(np.absolute(self.d_star**2 - p**2))
-            for ii in np.where(star_diam == True)[0]:
-                xx = x[ii] + p
-                flux1 = self.__bar_fresnel(xx, x01, x02, fresnel_scale_1, opacity)
-                flux2 = self.__bar_fresnel(xx, x01, x02, fresnel_scale_2, opacity)
-                flux_star_1[ii] = np.sum(coeff*flux1)/coeff.sum()
-                flux_star_2[ii] = np.sum(coeff*flux2)/coeff.sum()
-                flux_star[ii] = (flux_star_1[ii] + flux_star_2[ii])/2.
-        flux_inst = np.zeros(len(time_obs))
-        for i in range(len(time_obs)):
-            event_model = (time_model > time_obs[i]-self.exptime/2.) & (time_model < time_obs[i]+self.exptime/2.)
-            flux_inst[i] = (flux_star[event_model]).mean()
-        self.model[mask] = flux_inst*(flux_max - flux_min) + flux_min
+        mask = np.asarray(mask)
+        key = (immersion_time, emersion_time, opacity, npt_star, time_resolution_factor, flux_min, flux_max,
+               star_method, adaptive_grid, hashlib.sha1(mask.tobytes()).hexdigest(), mask.dtype.str, mask.shape,
+               getattr(self, 'vel', None), getattr(self, 'dist', None), getattr(self, 'd_star', None),
+               self.exptime, self.lambda_0, self.delta_lambda,
+               None if self.fresnel_table is None else tuple(sorted(self.fresnel_table.items())))
+        if key in self.__model_cache:
+            self.__model_cache.move_to_end(key)
+            self.__model_cache_info['hits'] += 1
+            (flux_inst, time_model, model_star, model_fresnel, model_geometric,
+             model_resolution) = self.__model_cache[key]
+        else:
+            self.__model_cache_info['misses'] += 1
+            edges = [immersion_time, emersion_time] if adaptive_grid else None
+            grid = self.__model_grid(mask, time_resolution_factor=time_resolution_factor, edges=edges)
+            time_model = grid['time_model']
+            # __model_grid() sets the model resolution, which is restored with the cached model
+            model_resolution = self.model_resolution
+            flux_fresnel, flux_star = model_flux(grid, immersion_time, emersion_time, opacity,
+                                                 npt_star=npt_star, star_method=star_method)
+            flux_fresnel, flux_star = flux_fresnel[0], flux_star[0]
+            flux_inst = integrate_exposure(time_model, flux_star, grid['time_obs'], self.exptime,
+                                           method=grid['integration'])
+            flux_inst = flux_inst*(flux_max - flux_min) + flux_min
+            model_star = flux_star*(flux_max - flux_min) + flux_min
+            model_fresnel = flux_fresnel*(flux_max - flux_min) + flux_min
+            ev_model = (time_model > immersion_time) & (time_model < emersion_time)
+            flux_box = np.ones(len(time_model))
+            flux_box[ev_model] = (1-opacity)**2
+            model_geometric = flux_box*(flux_max - flux_min) + flux_min
+            if self.__model_cache_info['maxsize'] > 0:
+                for array in [flux_inst, time_model, model_star, model_fresnel, model_geometric]:
+                    array.flags.writeable = False
+                self.__model_cache[key] = (flux_inst, time_model, model_star, model_fresnel, model_geometric,
+                                           model_resolution)
+                while len(self.__model_cache) > self.__model_cache_info['maxsize']:
+                    self.__model_cache.popitem(last=False)
+        self.model[mask] = flux_inst
         self.time_model = time_model
-        self.model_star = flux_star*(flux_max - flux_min) + flux_min
-        self.model_fresnel = flux_fresnel*(flux_max - flux_min) + flux_min
-        ev_model = (time_model > immersion_time) & (time_model < emersion_time)
-        flux_box = np.ones(len(time_model))
-        flux_box[ev_model] = (1-opacity)**2
-        flux_box = flux_box*(flux_max - flux_min) + flux_min
-        self.model_geometric = flux_box
+        self.model_star = model_star
+        self.model_fresnel = model_fresnel
+        self.model_geometric = model_geometric
+        self.model_resolution = model_resolution
         self.baseflux = flux_max
         self.bottomflux = flux_min
         return
@@ -653,32 +1835,66 @@ class LightCurve():
         """ Monte Carlo chi square fit for occultations lightcurve.
 
         Parameters:
-            tmin (int,float): Minimum time to consider in the fit procedure, in seconds
-            tmax (int,float): Maximum time to consider in the fit procedure, in seconds
+            tmin (int,float): Minimum time to consider in the fit procedure, in seconds.
+                Default is the start of the window, if it was set by set_window()
+            tmax (int,float): Maximum time to consider in the fit procedure, in seconds.
+                Default is the end of the window, if it was set by set_window()
             flux_min (int,float): Bottom flux (only object). Default=0.0
             flux_max (int,float): Base flux (object plus star). Default=1.0
+            fit_flux (bool): If True, flux_min and flux_max are solved by linear least squares for each
+                test and saved in the ChiSquare object. The given flux_min and flux_max are not used.
+                Default=False
             immersion_time (int, float): Initial guess for immersion time, in seconds.
             emersion_time (int, float): Initial guess for emersion time, in seconds.
             opacity (int, float): Initial guess for opacity. Opaque=1.0, transparent=0.0. Default=1.0
             delta_t (int, float): Interval to fit immersion or emersion time
             dopacity (int, float): Interval to fit opacity. Default=0
-            loop (int): Number of tests to be done. Default=10000
+            loop (int): Number of tests to be done. The adaptive method uses half of them in the coarse
+                search and half of the remaining ones in each iteration, stopping when it converges or when
+                an iteration would have less than 100 tests, so it does at most loop tests. Default=10000
+            method (str): Method used to draw the tests. 'random' draws all of them uniformly within the
+                given intervals. 'adaptive' makes a coarse search and then iteratively shrinks the intervals
+                around the 3-sigma region, until the 1-sigma and 3-sigma results converge. Default='random'
+            tolerance (float): For the adaptive method, the maximum change of the 1-sigma and 3-sigma values
+                and errors between iterations, relative to the 1-sigma error, to consider it converged.
+                Default=0.05
+            max_iter (int): Maximum number of iterations of the adaptive method. Default=20
+            adaptive_grid (bool): If True, the models are computed with the fine resolution only where the
+                immersion and emersion are tested, as in occ_model(). Default=False
+            edge_model (bool): If True, the immersion and emersion profiles are computed once and each
+                test is assembled from them plus a flat bottom, instead of a full model. It is valid when
+                the occultation is much longer than the fresnel scale, the stellar diameter and the
+                exposure. The profiles are integrated exactly over the exposure and agree with a model of
+                20 times finer resolution within about 3e-3 of the flux drop, while the full model with the
+                default resolution may differ from it by up to 2e-2, so both may differ by that much.
+                Default=False
+            memory_limit (int, float): Approximate memory, in MB, used to evaluate at once the models
+                of a batch of tests. Default=256
+            seed (int): Seed of the random number generator, to reproduce the fit. For a given seed,
+                the result does not depend on the number of workers. Default=None
+            workers (int): Number of processes used to evaluate the tests. Default=1
+            executor (concurrent.futures.Executor): Executor used to evaluate the tests, instead of a new
+                process pool. If given, workers is not used. Default=None
 
         Returns:
             chi2 (ChiSquare): ChiSquare object
         """
         allowed_kwargs = ['tmin', 'tmax', 'flux_min', 'flux_max', 'immersion_time', 'emersion_time', 'opacity',
-                          'delta_t', 'dopacity', 'loop']
+                          'delta_t', 'dopacity', 'loop', 'memory_limit', 'seed', 'workers', 'executor', 'method',
+                          'tolerance', 'max_iter', 'fit_flux', 'edge_model', 'adaptive_grid']
         input_tests.check_kwargs(kwargs, allowed_kwargs=allowed_kwargs)
 
         if not hasattr(self, 'flux'):
             raise ValueError('Fit curve is only possible when a LightCurve is instatiated with time and flux.')
+        method = kwargs.get('method', 'random')
+        if method not in ['random', 'adaptive']:
+            raise ValueError("method must be 'random' or 'adaptive'")
         delta_t = 2*self.cycle
         loop = kwargs.get('loop', 10000)
-        t_i = np.zeros(loop)
-        t_e = np.zeros(loop)
         tmax = self.time.max()
         tmin = self.time.min()
+        if self.window is not None:
+            tmin, tmax = self.window['tmin'], self.window['tmax']
         immersion_time = tmin - self.exptime
         do_immersion = False
         emersion_time = tmax + self.exptime
@@ -707,11 +1923,9 @@ class LightCurve():
         if 'immersion_time' in kwargs:
             immersion_time = kwargs['immersion_time']
             do_immersion = True
-        t_i = immersion_time + delta_t*(2*np.random.random(loop) - 1)
         if 'emersion_time' in kwargs:
             emersion_time = kwargs['emersion_time']
             do_emersion = True
-        t_e = emersion_time + delta_t*(2*np.random.random(loop) - 1)
         mask = (self.time >= tmin) & (self.time <= tmax)
         mask_sigma = (((self.time >= tmin) & (self.time < immersion_time - self.exptime)) +
                       ((self.time > emersion_time + self.exptime) & (self.time <= tmax)))
@@ -719,8 +1933,6 @@ class LightCurve():
         if 'dopacity' in kwargs:
             delta_opacity = kwargs['dopacity']
             do_opacity = True
-        opas = opacity + delta_opacity*(2*np.random.random(loop) - 1)
-        opas[opas > 1.], opas[opas < 0.] = 1.0, 0.0
         flux_min = 0
         flux_max = 1
         if 'flux_min' in kwargs:
@@ -728,14 +1940,55 @@ class LightCurve():
         if 'flux_max' in kwargs:
             flux_max = kwargs['flux_max']
 
-        tflag = np.zeros(loop)
-        tflag[t_i > t_e] = t_i[t_i > t_e]
-        t_i[t_i > t_e] = t_e[t_i > t_e]
-        t_e[t_i > t_e] = tflag[t_i > t_e]
-        chi2 = 999999*np.ones(loop)
-        for i in range(loop):
-            model_test = self.__occ_model(t_i[i], t_e[i], opas[i], mask, flux_min=flux_min, flux_max=flux_max)
-            chi2[i] = np.sum((self.flux[mask] - model_test)**2)/(sigma**2)
+        edges = [immersion_time, emersion_time] if kwargs.get('adaptive_grid', False) else None
+        # the adaptive method may move the intervals up to delta_t away from the initial ones
+        grid = self.__model_grid(mask, edge_model=kwargs.get('edge_model', False), edges=edges,
+                                 delta_t=delta_t*(2 if method == 'adaptive' else 1))
+        if grid['edge'] is not None:
+            edge_time = self.exptime + (10*np.max(grid['fresnel_scale']) + 3*self.d_star)/grid['vel']
+            if emersion_time - immersion_time - 2*delta_t < 2*edge_time:
+                warnings.warn('The occultation may be too short for edge_model. The immersion and emersion '
+                              'profiles overlap within {:.3f} seconds.'.format(edge_time))
+        seed = np.random.SeedSequence(kwargs.get('seed'))
+        centers = [immersion_time, emersion_time, opacity]
+        deltas = [delta_t, delta_t, delta_opacity]
+        names = ['immersion', 'emersion', 'opacity']
+        fitted = [name for name, do in zip(names, [do_immersion, do_emersion, do_opacity]) if do]
+        args = (grid, self.flux[mask], sigma, flux_min, flux_max, kwargs.get('memory_limit', 256),
+                kwargs.get('fit_flux', False))
+        executor = kwargs.get('executor')
+        pool = None
+        if executor is None and kwargs.get('workers', 1) > 1:
+            executor = pool = ProcessPoolExecutor(max_workers=kwargs['workers'])
+        try:
+            # the adaptive method shares the tests between the coarse search and the iterations
+            size = loop if method == 'random' else loop//2
+            remaining = loop - size
+            tests = self.__lcfit_tests(seed.spawn(1)[0], size, centers, deltas, *args, executor=executor)
+            previous = None
+            for i in range(kwargs.get('max_iter', 20) if method == 'adaptive' else 0):
+                chisquare = ChiSquare(tests[-1], len(self.flux[mask]),
+                                      **{name: tests[names.index(name)] for name in fitted})
+                intervals = [chisquare.get_nsigma(1), chisquare.get_nsigma(3)]
+                if previous is not None and self.__lcfit_converged(previous, intervals, fitted,
+                                                                   kwargs.get('tolerance', 0.05)):
+                    break
+                previous = intervals
+                size = remaining//2
+                if size < 100:
+                    break
+                remaining -= size
+                # the new intervals contain the 3-sigma region with a margin, shrinking at most 10 times
+                for name in fitted:
+                    k = names.index(name)
+                    centers[k] = intervals[1][name][0]
+                    deltas[k] = min(max(2*intervals[1][name][1], deltas[k]/10), deltas[k])
+                new_tests = self.__lcfit_tests(seed.spawn(1)[0], size, centers, deltas, *args, executor=executor)
+                tests = [np.concatenate([old, new]) for old, new in zip(tests, new_tests)]
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        t_i, t_e, opas, f_min, f_max, chi2 = tests
         kkargs = {}
         if do_immersion:
             kkargs['immersion'] = t_i
@@ -743,6 +1996,9 @@ class LightCurve():
             kkargs['emersion'] = t_e
         if do_opacity:
             kkargs['opacity'] = opas
+        if kwargs.get('fit_flux', False):
+            kkargs['flux_min'] = f_min
+            kkargs['flux_max'] = f_max
         chisquare = ChiSquare(chi2, len(self.flux[mask]), **kkargs)
         onesigma = chisquare.get_nsigma(1)
         if 'immersion' in onesigma:
@@ -765,9 +2021,12 @@ class LightCurve():
                 pass
         if 'opacity' in onesigma:
             opacity = onesigma['opacity'][0]
+        if 'flux_min' in onesigma:
+            flux_min = onesigma['flux_min'][0]
+            flux_max = onesigma['flux_max'][0]
         # Run occ_model() to save best parameters in the Object.
-        self.occ_model(immersion_time, emersion_time, opacity, np.repeat(True, len(self.flux)),
-                       flux_min=flux_min, flux_max=flux_max)
+        self.occ_model(immersion_time, emersion_time, opacity, self.__window_mask(),
+                       flux_min=flux_min, flux_max=flux_max, adaptive_grid=kwargs.get('adaptive_grid', False))
         self.lc_sigma = sigma
         self.chisquare = chisquare
         self.opacity = opacity
@@ -823,7 +2082,10 @@ class LightCurve():
         """ Saves the light curve to a file
 
         Parameters:
-            namefile (str): Filename to save the data
+            namefile (str): Filename to save the data. If a window is set, only the points
+                inside the window are saved. If the extension is '.npz' or '.fits', the data
+                is saved in binary format, with the instant of reference, which can be read
+                back by LightCurve(file=namefile, ...).
         """
         # Observational data
         if namefile is None:
@@ -832,13 +2094,29 @@ class LightCurve():
         else:
             folder = os.path.dirname(namefile)
             file = os.path.basename(namefile)
-        data = np.array([(self.time*u.s + self.tref).jd, self.time, self.flux, self.model, self.flux-self.model])
+        window = self.__window_mask()
+        data = np.array([(self.time[window]*u.s + self.tref).jd, self.time[window], self.flux[window],
+                         self.model[window], self.flux[window]-self.model[window]])
         colunm_names = ['Time JD', 'Time relative to {} UTC in seconds'.format(self.tref.iso),
                         'Observational Flux', 'Modelled Flux', 'Residual O-C']
+        if os.path.splitext(file)[1].lower() in ['.npz', '.fits']:
+            keys = ['time_jd', 'time', 'flux', 'model', 'residual']
+            if self.dflux is not None:
+                data = np.vstack((data, self.dflux[window]))
+                keys.append('dflux')
+            self.__save_binary(os.path.join(folder, file), keys, data)
+            if all(self.time_model):
+                data_model = np.array([(self.time_model*u.s + self.tref).jd, self.time_model,
+                                       self.model_geometric, self.model_fresnel, self.model_star])
+                keys = ['time_jd', 'time', 'geometric', 'fresnel', 'star']
+                self.__save_binary(os.path.join(folder, 'model_'+file), keys, data_model)
+            return
         np.savetxt(os.path.join(folder, file), data.T, fmt='%11.8f')
         f = open(os.path.join(folder, file) + '.label', 'w')
         for i, name in enumerate(colunm_names):
             f.write('Column {}: {}\n'.format(i+1, name))
+        if self.window is not None:
+            f.write('Window: {tmin} to {tmax} seconds, decimation {decimation}\n'.format(**self.window))
         f.close()
         # Complete Model
         if all(self.time_model):
@@ -852,6 +2130,23 @@ class LightCurve():
                 f.write('Column {}: {}\n'.format(i+1, name))
             f.close()
 
+    def __save_binary(self, namefile, keys, data):
+        """ Saves the columns of data, named by keys, in a '.npz' or '.fits' file,
+            with the instant of reference and the window
+        """
+        meta = {'tref': self.tref.utc.isot}
+        if self.window is not None:
+            meta.update(self.window)
+        if namefile.lower().endswith('.npz'):
+            np.savez(namefile, **dict(zip(keys, data)), **meta)
+        else:
+            from astropy.io import fits
+            columns = [fits.Column(name=key, format='D', array=column) for key, column in zip(keys, data)]
+            hdu = fits.BinTableHDU.from_columns(columns)
+            for key, value in meta.items():
+                hdu.header[key.upper()[:8]] = value
+            hdu.writeto(namefile, overwrite=True)
+
     def occ_detect(self, maximum_duration=None, dur_step=None, snr_limit=None,
                    n_detections=None, plot=False):
         """ Detects automatically the occultation event in the light curve
@@ -860,11 +2155,13 @@ class LightCurve():
         Parameters:
         (All parameters are optional)
             maximum_duration (float): Maximum duration of the occultation event. Default: light curve's time span
-            dur_step (float): Step size to sweep occultation duration event. Default=1/2 of sampling
+            dur_step (float): Deprecated and not used. Every data point is tested as an edge of the event,
+                which is the finest step possible. A FutureWarning is raised if it is given.
             snr_limit (float): Minimum occultation SNR. Default=none
             n_detections (int): Number of detections regardless the SNR.
                 n_detections is superseded by snr_limit. Default=1
             plot (boolean): True if output plots are desired.
+        If a window was set by set_window(), only the points inside it are searched.
 
         Returns:
             OrderedDict = An ordered dictionary of :attr:`name`::attr:`value` pairs for each Parameter.
@@ -890,6 +2187,9 @@ class LightCurve():
         if not hasattr(self, 'flux'):
             raise ValueError('time and flux must be instantiated to use ',
                              'occ_detect function.')
+        if dur_step is not None:
+            warnings.warn("'dur_step' is deprecated and will be removed in {}; every data point is already tested "
+                          "as an edge of the event".format(next_major_version), FutureWarning, stacklevel=2)
 
         # duration of the light curve
         time_span = self.time[-1]-self.time[0]
@@ -902,64 +2202,32 @@ class LightCurve():
         if not maximum_duration:
             maximum_duration = time_span
 
-        if not dur_step:
-            dur_step = self.cycle/2
-
-        if dur_step < self.cycle/2:
-            warnings.warn('The given dur_step is oversampled by a factor ',
-                          'of {0:0.1f} and has been reset to half a cycle ',
-                          '({1:0.4f}).'
-                          .format((self.cycle/2.)/dur_step, self.cycle/2.))
-            dur_step = self.cycle/2
-
-        duration_grid = np.arange(dur_step, maximum_duration, dur_step)
-        # initial occultation mask (all data points)
-        mask = np.ones(len(self.time), dtype=bool)
-        # inital detection rank
-        rank = 1
-
+        # the score of the boxes is computed once and updated locally after each detection
+        window = self.__window_mask()
+        search = BoxSearch(self.time[window], self.flux[window],
+                           dflux=None if self.dflux is None else self.dflux[window], maximum_duration=maximum_duration)
+        occs = [self.__run_box(search)]
+        if occs[0] is None:
+            raise ValueError('No occultation could be fitted to the data')
         if snr_limit:
             # minimum SNR accepted in a detection for multiple search
-            snr_value = snr_limit+1
-            occ0 = self.__run_bls(time_span, duration_grid)
-            mask *= ~occ0['occ_mask']
-            while (snr_value > snr_limit):
-                rank += 1
-                occ1 = self.__run_bls(time_span, duration_grid, mask=mask,
-                                      rank=rank)
-                if occ1['snr'] > snr_limit:
-                    snr_value = occ1['snr']
-                    mask *= ~occ1['occ_mask']
-                    occ0 = self.__summarize_bls(occ0, occ1)
-                else:
-                    snr_value = snr_limit
-
-            if plot:
-                self.__plot_occ_detect(occ0)
-            return occ0
+            while True:
+                occ = self.__run_box(search, rank=len(occs)+1)
+                if occ is None or occ['snr'] <= snr_limit:
+                    break
+                occs.append(occ)
         elif n_detections:
             # search the n best fits
-            occ0 = self.__run_bls(time_span, duration_grid)
-            mask *= ~occ0['occ_mask']
-            for i in range(n_detections-1):
-                rank += 1
-                occ1 = self.__run_bls(time_span, duration_grid, mask=mask,
-                                      rank=rank)
-                snr_value = occ1['snr']
-                mask *= ~occ1['occ_mask']
-                occ0 = self.__summarize_bls(occ0, occ1)
-
-            if plot:
-                self.__plot_occ_detect(occ0)
-            return occ0
-        else:
-            # search only the first best fit
-            occ0 = self.__run_bls(time_span, duration_grid)
-
-            if plot:
-                self.__plot_occ_detect(occ0)
+            while len(occs) < n_detections:
+                occ = self.__run_box(search, rank=len(occs)+1)
+                if occ is None:
+                    break
+                occs.append(occ)
+        occ = self.__summarize_box(occs)
 
-            return occ0
+        if plot:
+            self.__plot_occ_detect(occ)
+        return occ
 
     def __plot_occ_detect(self, occ):
         n = np.size(occ['rank'])
@@ -992,37 +2260,19 @@ class LightCurve():
             pl.ylabel('Relative Flux')
             pl.legend()
 
-    def __run_bls(self, per_grid, dur_grid, mask=None, rank=None):
-        """ Private function to find the best box fit suitable to the data
+    def __run_box(self, search, rank=None):
+        """ Private function to find the next best box fit suitable to the data.
+            It returns None if no box is left in the search.
         """
-
-        # object with no occultation mask
-        mskmodel = BoxLeastSquares(self.time, self.flux, dy=self.dflux)
-        # if there is no dflux array, reset it to None in case of
-        # using a mask
-        if self.dflux is None:
-            dfluxmask = None
-        else:
-            dfluxmask = self.dflux[mask]
-
-        # object with occultation mask
-        if np.sum(mask):
-            model = BoxLeastSquares(self.time[mask], self.flux[mask],
-                                    dy=dfluxmask)
-        else:
-            model = mskmodel
-
-        r = model.power(per_grid, dur_grid, objective='snr', method='fast')
-        # statistics of the BLS fit
-        stats = model.compute_stats(r.period, r.duration, r.transit_time)
+        event = search.next_event()
+        if event is None:
+            return None
+        immersion_time, emersion_time, _ = event
         # occultation mask of the event with respect to all data
-        occ_mask = mskmodel.transit_mask(self.time, r.period, r.duration,
-                                         r.transit_time)
+        occ_mask = (self.time > immersion_time) & (self.time < emersion_time)
         # parameters computation for clarity purposes
-        occultation_duration = r.duration[0]
-        central_time = stats['transit_times'][0]
-        immersion_time = stats['transit_times'][0] - r.duration[0]/2
-        emersion_time = stats['transit_times'][0] + r.duration[0]/2
+        occultation_duration = emersion_time - immersion_time
+        central_time = (immersion_time + emersion_time)/2
         time_err = np.median(self.time[1:-1]-self.time[0:-2])/2
         depth = np.mean(self.flux[~occ_mask])-np.mean(self.flux[occ_mask])
         depth_err = np.std(self.flux[occ_mask], ddof=1)
@@ -1051,58 +2301,17 @@ class LightCurve():
                 'baseline': baseline, 'baseline_err': baseline_err,
                 'snr': snr, 'occ_mask': occ_mask}
 
-    def __summarize_bls(self, dict1, dict2):
-        """ Private function to merge dictionaries returned by BLS and
-            to keep values of common keys in list.
+    def __summarize_box(self, occs):
+        """ Private function to merge the dictionaries returned by __run_box,
+            keeping the values of common keys in arrays (occ_mask in a list).
         """
-        dict3 = {}
-        for key, value in dict1.items():
-            if key == 'occ_mask':
-                sz = int(np.size(dict1[key])/np.size(dict2[key]))
-                if sz > 1:
-                    k = [None]*(sz+1)
-                    for i in range(sz):
-                        k[i] = dict1[key][i]
-                    k[i+1] = dict2[key]
-                    dict3[key] = k
-                else:
-                    dict3[key] = [dict1[key], dict2[key]]
-            else:
-                dict3[key] = np.append(dict1[key], dict2[key])
-        return dict3
-
-    def __bar_fresnel(self, X, X01, X02, fresnel_scale, opacity):
-        """ Returns the modelled light curve considering fresnel difraction.
-
-        Parameters:
-            X (array): Array with time values converted in km using the event velocity.
-            X01 (int, float): Immersion time converted in km using the event velocity.
-            X02 (int, float): Emersion time converted in km using the event velocity.
-            fresnel_scale (int, float): Fresnel scale, in km.
-            opacity (int, float): Opacity. Opaque = 1.0, transparent = 0.0
-
-        Returns:
-            flux_fresnel (array): the light curve with fresnel diffraction
-        """
-        # Converting from km to units of fresnel scale
-        x = X/fresnel_scale
-        x01 = X01/fresnel_scale
-        x02 = X02/fresnel_scale
-        # Fresnel difraction parameters
-        x1 = x - x01
-        x2 = x - x02
-        s1, c1 = scsp.fresnel(x1)
-        s2, c2 = scsp.fresnel(x2)
-        cc = c1 - c2
-        ss = s1 - s2
-        r_ampli = - (cc+ss)*(opacity/2.)
-        i_ampli = (cc-ss)*(opacity/2.)
-        # Determining the flux considering fresnel difraction
-        flux_fresnel = (1.0 + r_ampli)**2 + (i_ampli)**2
-        return flux_fresnel
+        if len(occs) == 1:
+            return occs[0]
+        return {key: [occ[key] for occ in occs] if key == 'occ_mask' else np.array([occ[key] for occ in occs])
+                for key in occs[0]}
 
     def __occ_model(self, immersion_time, emersion_time, opacity, mask, npt_star=12,
-                    time_resolution_factor=10, flux_min=0.0, flux_max=1.0):
+                    time_resolution_factor=10, flux_min=0.0, flux_max=1.0, star_method='direct'):
         """ Private function returns the modelled light curve considering fresnel difraction,
             star diameter and intrumental response, intended for fitting inside the self.occ_lcfit().
 
@@ -1116,10 +2325,34 @@ class LightCurve():
                 Default=10*fresnel scale.
             flux_min (int,float): Bottom flux (only object). Default=0.0
             flux_max (int,float): Base flux (object plus star). Default=1.0
+            star_method (str): Method used to average the diffraction over the stellar disk,
+                'direct' or 'fft'. Default='direct'
 
         Returns:
             flux_inst (array): Modelled Instrumental light flux.
         """
+        grid = self.__model_grid(mask, time_resolution_factor=time_resolution_factor)
+        return model_inst(grid, immersion_time, emersion_time, opacity, npt_star=npt_star,
+                          flux_min=flux_min, flux_max=flux_max, star_method=star_method)[0]
+
+    def __model_grid(self, mask, time_resolution_factor=10, edge_model=False, edges=None, delta_t=0.0):
+        """ Private function that returns the parts of the light curve model that do not depend
+            on the immersion, emersion and opacity: the high resolution time grid, the fresnel scales
+            and the observed times inside the mask.
+
+        Parameters:
+            mask (array with Booleans): Mask with True values to be computed
+            time_resolution_factor (int,float): Steps for fresnel scale used for modelling the light curve.
+                Default=10*fresnel scale.
+            edge_model (bool): If True, the grid includes the cached edge profiles. Default=False
+            edges (list): If given, the times of the immersion and emersion, in seconds. The model grid is
+                fine only within delta_t plus 20 fresnel scales, 3 stellar diameters and one exposure of them,
+                and half an exposure elsewhere. Default=None
+            delta_t (int, float): Interval around the edges where they may be, in seconds. Default=0
+
+        Returns:
+            grid (dict): Dictionary with the model grid and constants.
+        """
         # Computing the fresnel scale
         lamb = self.lambda_0*u.micrometer.to('km')
         dlamb = self.delta_lambda*u.micrometer.to('km')
@@ -1133,39 +2366,80 @@ class LightCurve():
         self.model_resolution = time_resolution
 
         # Creating a high resolution curve to compute fresnel difraction, stellar diameter and instrumental integration
-        time_model = np.arange(time_obs.min()-5*self.exptime, time_obs.max()+5*self.exptime, time_resolution)
+        if edges is None:
+            time_model = np.arange(time_obs.min()-5*self.exptime, time_obs.max()+5*self.exptime, time_resolution)
+            integration = 'mean'
+        else:
+            margin = delta_t + self.exptime + (20*np.max([fresnel_scale_1, fresnel_scale_2]) + 3*self.d_star)/vel
+            time_model = adaptive_time_grid(time_obs.min()-5*self.exptime, time_obs.max()+5*self.exptime,
+                                            [(edge - margin, edge + margin) for edge in edges], time_resolution,
+                                            np.max([time_resolution, self.exptime/2.]))
+            integration = 'trapezoid'
 
         # Changing X: time (s) to distances in the sky plane (km), considering the tangential velocity (vel in km/s)
         x = time_model*vel
-        x01 = immersion_time*vel
-        x02 = emersion_time*vel
-
-        # Computing fresnel diffraction for the case where the star size is negligenciable
-        flux_fresnel_1 = self.__bar_fresnel(x, x01, x02, fresnel_scale_1, opacity)
-        flux_fresnel_2 = self.__bar_fresnel(x, x01, x02, fresnel_scale_2, opacity)
-        flux_fresnel = (flux_fresnel_1 + flux_fresnel_2)/2.
-        flux_star = flux_fresnel.copy()
-        if (self.d_star > 0):
-            # Computing fresnel diffraction for the case where the star size is not negligenciable
-            resolucao = self.d_star/npt_star
-            flux_star_1 = np.zeros(len(time_model))
-            flux_star_2 = np.zeros(len(time_model))
-            # Computing stellar diameter only near the immersion or emersion times
-            star_diam = (np.absolute(x - x01) < 3*self.d_star) + (np.absolute(x - x02) < 3*self.d_star)
-            p = np.arange(-npt_star, npt_star)*resolucao
-            coeff = np.sqrt(np.absolute(self.d_star**2 - p**2))
-            for ii in np.where(star_diam == True)[0]:
-                xx = x[ii] + p
-                flux1 = self.__bar_fresnel(xx, x01, x02, fresnel_scale_1, opacity)
-                flux2 = self.__bar_fresnel(xx, x01, x02, fresnel_scale_2, opacity)
-                flux_star_1[ii] = np.sum(coeff*flux1)/coeff.sum()
-                flux_star_2[ii] = np.sum(coeff*flux2)/coeff.sum()
-                flux_star[ii] = (flux_star_1[ii] + flux_star_2[ii])/2.
-        flux_inst = np.zeros(len(time_obs))
-        for i in range(len(time_obs)):
-            event_model = (time_model > time_obs[i]-self.exptime/2.) & (time_model < time_obs[i]+self.exptime/2.)
-            flux_inst[i] = (flux_star[event_model]).mean()
-        return flux_inst*(flux_max - flux_min) + flux_min
+        edge = None
+        if edge_model:
+            edge = edge_profile(fresnel_scale_1, fresnel_scale_2, vel, self.d_star, self.exptime, time_resolution)
+        # in the adaptive grid, the fringes that are not resolved by the steps are smoothed in model_flux()
+        step = None if edges is None else np.gradient(x)
+        return {'time_obs': time_obs, 'time_model': time_model, 'x': x, 'vel': vel,
+                'exptime': self.exptime, 'd_star': self.d_star, 'fresnel_scale': [fresnel_scale_1, fresnel_scale_2],
+                'table': [self.__fresnel_table(fresnel_scale_1, x), self.__fresnel_table(fresnel_scale_2, x)],
+                'edge': edge, 'integration': integration, 'step': step}
+
+    @staticmethod
+    def __lcfit_tests(seed, loop, centers, deltas, grid, flux_obs, sigma, flux_min, flux_max, memory_limit,
+                      fit_flux=False, executor=None):
+        """ Runs Monte Carlo tests of occ_lcfit() within the given intervals.
+
+        The tests are divided in blocks of 1000 with independent random streams spawned from seed,
+        so the result does not depend on the executor. With an executor, the blocks are grouped in a
+        few tasks per worker, so the model grid is sent to the workers only a few times.
+
+        Parameters:
+            seed (SeedSequence): Seed of the random streams.
+            loop (int): Number of tests.
+            centers (list): Central values of immersion, emersion and opacity.
+            deltas (list): Intervals of immersion, emersion and opacity.
+            grid, flux_obs, sigma, flux_min, flux_max, memory_limit, fit_flux: As in _lcfit_block().
+            executor (concurrent.futures.Executor): Executor used to evaluate the blocks. Default=None
+
+        Returns:
+            t_i, t_e, opas, f_min, f_max, chi2 (array): The tested parameters and their chi-square.
+        """
+        block = 1000
+        seeds = seed.spawn(int(np.ceil(loop/block)))
+        sizes = [min(block, loop - i*block) for i in range(len(seeds))]
+        args = (*centers, *deltas, flux_min, flux_max, memory_limit, fit_flux)
+        if executor is None:
+            return _lcfit_blocks(grid, flux_obs, sigma, seeds, sizes, *args)
+        n_tasks = min(len(seeds), 4*(getattr(executor, '_max_workers', None) or os.cpu_count() or 1))
+        groups = np.array_split(np.arange(len(seeds)), n_tasks)
+        tasks = executor.map(_lcfit_blocks, itertools.repeat(grid), itertools.repeat(flux_obs),
+                             itertools.repeat(sigma), [[seeds[i] for i in group] for group in groups],
+                             [[sizes[i] for i in group] for group in groups], *[itertools.repeat(arg) for arg in args])
+        return [np.concatenate(values) for values in zip(*tasks)]
+
+    @staticmethod
+    def __lcfit_converged(previous, intervals, names, tolerance):
+        """ Checks if the 1-sigma and 3-sigma results of two iterations of occ_lcfit() agree.
+
+        Parameters:
+            previous (list): Results of get_nsigma(1) and get_nsigma(3) of the previous iteration.
+            intervals (list): Results of get_nsigma(1) and get_nsigma(3) of the current iteration.
+            names (list): Names of the fitted parameters.
+            tolerance (float): Maximum change relative to the previous 1-sigma error.
+
+        Returns:
+            converged (bool): True if all values and errors changed less than the tolerance.
+        """
+        for name in names:
+            scale = previous[0][name][1] if previous[0][name][1] > 0 else previous[1][name][1]
+            for old, new in zip(previous, intervals):
+                if np.any(np.absolute(np.array(new[name]) - np.array(old[name])) > tolerance*scale):
+                    return False
+        return True
 
     def __str__(self):
         """ String representation of the LightCurve Object
@@ -1235,3 +2509,322 @@ class LightCurve():
             self.__names.remove(self.__name)
         except:
             pass
+
+
+def _load_lightcurve(name, kwargs):
+    """ Creates a LightCurve, used by LightCurveSet to load the files in parallel.
+        Returns the LightCurve, or None, and the error raised.
+    """
+    try:
+        return LightCurve(name=name, **kwargs), None
+    except Exception as error:
+        return None, error
+
+
+def _run_lightcurve(lc, method, kwargs):
+    """ Calls a method of a LightCurve, used by LightCurveSet to process the light curves in parallel.
+        Returns the LightCurve (a copy, if called in another process), the result and the error raised.
+    """
+    try:
+        return lc, getattr(lc, method)(**kwargs), None
+    except Exception as error:
+        return lc, None, error
+
+
+class LightCurveSet():
+    """ Container of many LightCurve objects, loaded and processed in parallel.
+
+    Parameters:
+        lightcurves (list): LightCurve objects to be added to the set. Default=None
+
+    The methods normalize(), occ_detect() and occ_lcfit() call the LightCurve method of the same name
+    on every light curve, with a pool of workers, and return a Table with one row per light curve.
+    When the light curves are processed in other processes, they are replaced by the updated copies
+    returned by the workers. The results are kept in the attribute "results" and the errors raised by
+    the light curves that failed in the attribute "errors", both by method and by name.
+    """
+    def __init__(self, lightcurves=None):
+        self.__members = []
+        self.results = {}
+        self.errors = {}
+        for lc in lightcurves or []:
+            self.add(lc)
+
+    @property
+    def names(self):
+        return [lc.name for lc in self.__members]
+
+    def __len__(self):
+        return len(self.__members)
+
+    def __iter__(self):
+        return iter(self.__members)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key not in self.names:
+                raise KeyError('{} is not in the LightCurveSet'.format(key))
+            return self.__members[self.names.index(key)]
+        return self.__members[key]
+
+    def add(self, lc):
+        """ Adds a LightCurve to the set
+
+        Parameters:
+            lc (LightCurve): The light curve. Its name must not be in the set.
+        """
+        if not isinstance(lc, LightCurve):
+            raise TypeError('lc must be a LightCurve object')
+        if lc.name in self.names:
+            raise ValueError('{} is already in the LightCurveSet'.format(lc.name))
+        self.__members.append(lc)
+        # light curves created in other processes are not in the list of names of this process
+        if lc.name not in lc.check_names():
+            lc.check_names().append(lc.name)
+
+    def load(self, source, pattern='*', workers=1, executor=None, **kwargs):
+        """ Loads light curve files in parallel and adds them to the set
+
+        Parameters:
+            source (str, list): A directory, from which the files matching pattern are loaded,
+                a list of files, or a manifest file. Each line of the manifest has the name of the
+                light curve, the file and, optionally, the exposure time in seconds, separated by spaces.
+                Lines starting with '#' are ignored and relative paths are relative to the manifest.
+                For directories and lists, the name is the file name without the extension.
+            pattern (str): Pattern of the names of the files loaded from a directory. Default='*'
+            workers (int): Number of processes used to load the files. Default=1
+            executor (concurrent.futures.Executor): Executor used to load the files, instead of a new
+                process pool (e.g. a ThreadPoolExecutor). If given, workers is not used. Default=None
+        Kwargs:
+            Any parameter of LightCurve, given to all light curves (e.g. exptime, tref, usecols, vel,
+            dist, d_star). The exposure time in the manifest has priority over exptime.
+
+        Returns:
+            names (list): Names of the light curves loaded.
+        """
+        if isinstance(source, str) and os.path.isdir(source):
+            files = sorted(glob.glob(os.path.join(source, pattern)))
+            files = [file for file in files if os.path.isfile(file)]
+            entries = [(os.path.splitext(os.path.basename(file))[0], file, {}) for file in files]
+        elif isinstance(source, str) and os.path.isfile(source):
+            entries = []
+            folder = os.path.dirname(source)
+            with open(source) as f:
+                for line in f:
+                    line = line.split('#')[0].split()
+                    if not line:
+                        continue
+                    if len(line) not in [2, 3]:
+                        raise ValueError('Each line of the manifest must have the name, the file and, '
+                                         'optionally, the exposure time')
+                    entry = {'exptime': float(line[2])} if len(line) == 3 else {}
+                    entries.append((line[0], os.path.join(folder, line[1]), entry))
+        elif isinstance(source, str):
+            raise ValueError('{} not found'.format(source))
+        else:
+            entries = [(os.path.splitext(os.path.basename(file))[0], file, {}) for file in source]
+        names = [entry[0] for entry in entries]
+        if len(set(names)) != len(names) or set(names) & set(self.names):
+            raise ValueError('The names of the light curves must be unique')
+        args = [{**kwargs, 'file': file, **entry} for name, file, entry in entries]
+        loaded = self.__map(_load_lightcurve, workers, executor, names, args)
+        self.errors['load'] = {}
+        for name, (lc, error) in zip(names, loaded):
+            if error is not None:
+                self.errors['load'][name] = error
+            else:
+                self.add(lc)
+        self.__warn_errors('load')
+        return [name for name in names if name not in self.errors['load']]
+
+    def set_vel(self, vel):
+        """ Sets the occultation velocity of all light curves
+
+        Parameters:
+            vel (int,float,dict): velocity in km/s, or a dictionary with the velocity of each light curve
+        """
+        self.__set_all('set_vel', vel=vel)
+
+    def set_dist(self, dist):
+        """ Sets the object distance of all light curves
+
+        Parameters:
+            dist (int,float,dict): object distance in AU, or a dictionary with the distance of each light curve
+        """
+        self.__set_all('set_dist', dist=dist)
+
+    def set_star_diam(self, d_star):
+        """ Sets the star diameter of all light curves
+
+        Parameters:
+            d_star (float,dict): star diameter, in km, or a dictionary with the diameter of each light curve
+        """
+        self.__set_all('set_star_diam', d_star=d_star)
+
+    def set_exptime(self, exptime):
+        """ Sets the exposure time of all light curves
+
+        Parameters:
+            exptime (int,float,dict): exposure time, in seconds, or a dictionary with the exposure time
+                of each light curve
+        """
+        self.__set_all('set_exptime', exptime=exptime)
+
+    def set_filter(self, central_bandpass, delta_bandpass):
+        """ Sets the filter bandwidth of all light curves, in microns
+
+        Parameters:
+            central_bandpass (float,dict): center band in microns
+            delta_bandpass (float,dict): bandwidth in microns
+        Dictionaries give the value of each light curve.
+        """
+        self.__set_all('set_filter', central_bandpass=central_bandpass, delta_bandpass=delta_bandpass)
+
+    def normalize(self, workers=1, executor=None, **kwargs):
+        """ Normalizes all light curves in parallel with LightCurve.normalize()
+
+        Parameters:
+            workers (int): Number of processes. Default=1
+            executor (concurrent.futures.Executor): Executor used instead of a new process pool.
+                If given, workers is not used. Default=None
+        Kwargs:
+            Parameters of LightCurve.normalize(), given to all light curves.
+
+        Returns:
+            table (Table): Table with the name and the error of each light curve.
+        """
+        return self.__run('normalize', workers, executor, [kwargs]*len(self))
+
+    def occ_detect(self, workers=1, executor=None, **kwargs):
+        """ Detects the occultation in all light curves in parallel with LightCurve.occ_detect()
+
+        Parameters:
+            workers (int): Number of processes. Default=1
+            executor (concurrent.futures.Executor): Executor used instead of a new process pool.
+                If given, workers is not used. Default=None
+        Kwargs:
+            Parameters of LightCurve.occ_detect(), given to all light curves.
+
+        Returns:
+            table (Table): Table with the parameters of the event detected in each light curve.
+        """
+        return self.__run('occ_detect', workers, executor, [kwargs]*len(self))
+
+    def occ_lcfit(self, workers=1, executor=None, **kwargs):
+        """ Fits the occultation of all light curves in parallel with LightCurve.occ_lcfit()
+
+        Parameters:
+            workers (int): Number of processes, each fitting one light curve. Default=1
+            executor (concurrent.futures.Executor): Executor used instead of a new process pool.
+                If given, workers is not used. Default=None
+        Kwargs:
+            Parameters of LightCurve.occ_lcfit(), given to all light curves. If seed is given, each
+            light curve uses a seed derived from it and from its position in the set.
+
+        Returns:
+            table (Table): Table with the 1-sigma values of the fitted parameters of each light curve.
+        """
+        args = [kwargs]*len(self)
+        if kwargs.get('seed') is not None:
+            seeds = np.random.SeedSequence(kwargs['seed']).spawn(len(self))
+            args = [{**kwargs, 'seed': int(seed.generate_state(1)[0])} for seed in seeds]
+        return self.__run('occ_lcfit', workers, executor, args)
+
+    def table(self, method='occ_lcfit'):
+        """ Returns the results of a method as a Table, with one row per light curve
+
+        Parameters:
+            method (str): Name of the method ('normalize', 'occ_detect' or 'occ_lcfit'). Default='occ_lcfit'
+
+        Returns:
+            table (Table): Table with the name of the light curve, the scalar results and, for the pairs
+                of value and uncertainty, the value and a column with the suffix '_err'. The column 'error'
+                has the error raised by the light curves that failed. Arrays are not included.
+        """
+        if method not in self.results:
+            raise ValueError('{} was not run for this LightCurveSet'.format(method))
+        rows = []
+        for name in self.names:
+            if name not in self.results[method] and name not in self.errors[method]:
+                continue
+            result = self.results[method].get(name)
+            if isinstance(result, ChiSquare):
+                result = result.get_nsigma(1)
+            row = {'name': name, 'error': str(self.errors[method].get(name, ''))}
+            for key, value in (result if isinstance(result, dict) else {}).items():
+                if np.isscalar(value):
+                    row[key] = value
+                elif isinstance(value, (list, tuple)) and len(value) == 2 and all(np.isscalar(v) for v in value):
+                    row[key], row[key + '_err'] = value
+            rows.append(row)
+        keys = []
+        for row in rows:
+            keys += [key for key in row if key not in keys]
+        columns = []
+        for key in keys:
+            values = [row.get(key) for row in rows]
+            mask = [value is None for value in values]
+            if any(mask):
+                fill = [value for value in values if value is not None][0]
+                columns.append(MaskedColumn([fill if m else v for v, m in zip(values, mask)], name=key, mask=mask))
+            else:
+                columns.append(Column(values, name=key))
+        return Table(columns)
+
+    def __set_all(self, method, **kwargs):
+        """ Private function that calls a set method of all light curves. The values given as
+            dictionaries are set only on the light curves whose names are in the dictionary.
+        """
+        for lc in self.__members:
+            values = {}
+            for key, value in kwargs.items():
+                if not isinstance(value, dict):
+                    values[key] = value
+                elif lc.name in value:
+                    values[key] = value[lc.name]
+            if len(values) == len(kwargs):
+                getattr(lc, method)(**values)
+
+    def __run(self, method, workers, executor, args):
+        """ Private function that calls a method of all light curves in parallel, keeps the results
+            and returns them as a Table
+        """
+        processed = self.__map(_run_lightcurve, workers, executor, list(self.__members), [method]*len(self), args)
+        self.results[method] = {}
+        self.errors[method] = {}
+        for k, (lc, result, error) in enumerate(processed):
+            self.__members[k] = lc
+            if lc.name not in lc.check_names():
+                lc.check_names().append(lc.name)
+            if error is not None:
+                self.errors[method][lc.name] = error
+            else:
+                self.results[method][lc.name] = result
+        self.__warn_errors(method)
+        return self.table(method)
+
+    def __map(self, function, workers, executor, *iterables):
+        """ Private function that maps function over the iterables with the executor, a new process pool
+            if workers > 1, or serially
+        """
+        pool = None
+        if executor is None and workers > 1:
+            executor = pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            if executor is None:
+                return list(map(function, *iterables))
+            return list(executor.map(function, *iterables))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    def __warn_errors(self, method):
+        """ Private function that warns about the light curves that failed
+        """
+        for name, error in self.errors[method].items():
+            warnings.warn('{} failed for {}: {}'.format(method, name, error))
+
+    def __str__(self):
+        """ String representation of the LightCurveSet Object
+        """
+        return 'LightCurveSet with {} light curves: {}'.format(len(self), ', '.join(self.names))
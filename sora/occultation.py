@@ -3,15 +3,18 @@ from .ephem import EphemPlanete, EphemJPL, EphemKernel
 from .observer import Observer
 from .lightcurve import LightCurve
 from .prediction import occ_params, PredictionTable
-from .extra import ChiSquare
+from .extra import ChiSquare, ColumnStore
 from sora.body import Body
 from sora.config.decorators import deprecated_alias
 import astropy.units as u
 from astropy.coordinates import SkyCoord, SkyOffsetFrame
 from astropy.time import Time
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+import os
 import warnings
 import matplotlib.pyplot as plt
+from scipy.optimize import least_squares
 
 
 warnings.simplefilter('always', UserWarning)
@@ -63,10 +66,273 @@ def positionv(star, ephem, observer, time):
     return f, g, vf, vg
 
 
+def _ellipse_chi2(values, f0, g0, a, obla, phi_deg, chi2, work, terms=None):
+    """ Private function that computes the chi square of the ellipses in place.
+
+    The residual of each position is its radial distance to the ellipse, r - r_model, where
+    r_model is the radius of the ellipse in the direction of the position.
+
+    Parameters:
+        values (list): List with f, g and the error of each chord position, in km.
+        f0, g0, a, obla, phi_deg (array): Parameters of the ellipses.
+        chi2 (array): Array where the chi square is written.
+        work (array): Buffer with shape (10, len(chi2)) for the intermediate values.
+        terms (array): If given, array with shape (len(values), len(chi2)) where the squared residual
+            of each position, not divided by its error, is written. Default=None
+    """
+    ab, ca, sa, cb, sb, dfi, dgi, t1, t2, t3 = work
+    # a*cos(phi), a*sin(phi), b*cos(phi), b*sin(phi) and a*b
+    np.radians(phi_deg, out=t1)
+    np.cos(t1, out=ca)
+    np.sin(t1, out=sa)
+    np.subtract(1, obla, out=t2)
+    np.multiply(a, t2, out=t2)
+    np.multiply(t2, ca, out=cb)
+    np.multiply(t2, sa, out=sb)
+    np.multiply(a, t2, out=ab)
+    np.multiply(a, ca, out=ca)
+    np.multiply(a, sa, out=sa)
+    chi2[:] = 0
+    for k, (fi, gi, si) in enumerate(values):
+        np.subtract(fi, f0, out=dfi)
+        np.subtract(gi, g0, out=dgi)
+        # r*a*sin(theta + phi) and r*b*cos(theta + phi), with theta the direction of the position
+        np.multiply(dgi, ca, out=t1)
+        np.multiply(dfi, sa, out=t3)
+        np.add(t1, t3, out=t1)
+        np.multiply(dfi, cb, out=t2)
+        np.multiply(dgi, sb, out=t3)
+        np.subtract(t2, t3, out=t2)
+        # r - r_model = r*(1 - a*b/hypot(...))
+        np.hypot(t1, t2, out=t1)
+        np.divide(ab, t1, out=t1)
+        np.subtract(1, t1, out=t1)
+        np.hypot(dfi, dgi, out=t2)
+        np.multiply(t1, t2, out=t1)
+        np.square(t1, out=t1)
+        if terms is not None:
+            terms[k] = t1
+        np.multiply(t1, 1/si**2, out=t1)
+        np.add(chi2, t1, out=chi2)
+
+
+def _ellipse_lsq(values, centers, free):
+    """ Fits an ellipse by non-linear least squares on the radial residuals used in _ellipse_chi2().
+
+    Parameters:
+        values (list): List with f, g and the error of each chord position, in km.
+        centers (list): Initial values of center_f, center_g, equatorial_radius, oblateness and position_angle.
+        free (list): True for the parameters that are fitted. The others are kept fixed.
+
+    Returns:
+        params (array): The fitted center_f, center_g, equatorial_radius, oblateness and position_angle.
+        covariance (array): Covariance matrix of the parameters, with shape (5, 5). It is zero for the
+            fixed parameters.
+        chi2 (float): The chi square of the fitted ellipse.
+    """
+    fi, gi, si = np.array(values, dtype=float).reshape(-1, 3).T
+    free = np.asarray(free, dtype=bool)
+    params = np.array(centers, dtype=float)
+
+    def residuals(x):
+        params[free] = x
+        f0, g0, a, obla, phi = params[0], params[1], params[2], params[3], np.radians(params[4])
+        b = a*(1 - obla)
+        dfi, dgi = fi - f0, gi - g0
+        rho = np.hypot(a*(dgi*np.cos(phi) + dfi*np.sin(phi)), b*(dfi*np.cos(phi) - dgi*np.sin(phi)))
+        return np.hypot(dfi, dgi)*(1 - a*b/rho)/si
+
+    lower = np.array([-np.inf, -np.inf, 0, 0, -np.inf])[free]
+    upper = np.array([np.inf, np.inf, np.inf, 1, np.inf])[free]
+    result = least_squares(residuals, np.clip(params[free], lower, upper), bounds=(lower, upper), x_scale='jac')
+    residuals(result.x)
+    # covariance from the pseudo-inverse of J^T J, discarding the singular directions
+    _, sv, vt = np.linalg.svd(result.jac, full_matrices=False)
+    rank = np.sum(sv > np.finfo(float).eps*max(result.jac.shape)*sv[0])
+    if rank < free.sum():
+        warnings.warn('The chords do not constrain all the fitted parameters. Their errors are underestimated.')
+    covariance = np.zeros((5, 5))
+    covariance[np.ix_(free, free)] = (vt[:rank].T/sv[:rank]**2) @ vt[:rank]
+    return params, covariance, 2*result.cost
+
+
+def _ellipse_block(values, seed, size, centers, deltas, dchi_min=None, memory_limit=256, cache=False):
+    """ Evaluates a block of random ellipses of fit_ellipse() with its own random stream.
+
+    The ellipses are evaluated in chunks that fit in memory_limit. If dchi_min is given, only the
+    ellipses with chi square smaller than the minimum of the block plus dchi_min are returned.
+
+    Parameters:
+        values (list): List with f, g and the error of each chord position, in km.
+        seed (SeedSequence, int): Seed of the random stream of this block.
+        size (int): Number of ellipses in this block.
+        centers (list): Central values of center_f, center_g, equatorial_radius, oblateness and position_angle.
+        deltas (list): Intervals of center_f, center_g, equatorial_radius, oblateness and position_angle.
+        dchi_min (int,float): Interval of chi square of the ellipses returned. Default=None (all)
+        memory_limit (int,float): Approximate memory, in MB, of the buffers. Default=256
+        cache (bool): If True, the squared residuals of each position are also returned. Default=False
+
+    Returns:
+        kept (array): Array with shape (6, n) with the chi square, center_f, center_g, equatorial_radius,
+            oblateness and position_angle of the ellipses returned.
+        terms (array): If cache is True, float32 array with shape (len(values), n) with the squared
+            residual of each position, not divided by its error.
+    """
+    rng = np.random.default_rng(seed)
+    # buffers of the parameters, chi square and intermediate values: 16 arrays of float64,
+    # plus the float32 residuals of each position if cache is True
+    chunk = int(max(1, min(size, memory_limit*2**20//(16*8 + (4*len(values) if cache else 0)))))
+    buffers = np.empty((16, chunk))
+    terms = np.empty((len(values), chunk), dtype=np.float32) if cache else None
+    kept = []
+    kept_terms = []
+    chi2_min = np.inf
+    for start in range(0, size, chunk):
+        n = min(chunk, size - start)
+        params, chi2, work = buffers[:5, :n], buffers[5, :n], buffers[6:, :n]
+        for param, center, delta in zip(params, centers, deltas):
+            rng.random(out=param)
+            param *= 2*delta
+            param += center - delta
+        np.clip(params[3], 0, 1, out=params[3])
+        _ellipse_chi2(values, *params, chi2, work, terms=None if terms is None else terms[:, :n])
+        if dchi_min is not None:
+            chi2_min = min(chi2_min, chi2.min())
+            region = np.where(chi2 < chi2_min + dchi_min)[0]
+        else:
+            region = slice(None)
+        kept.append(np.vstack((chi2[region], params[:, region])))
+        if cache:
+            kept_terms.append(terms[:, :n][:, region].copy())
+    kept = np.hstack(kept)
+    if cache:
+        kept_terms = np.hstack(kept_terms)
+    if dchi_min is not None:
+        region = kept[0] < chi2_min + dchi_min
+        kept = kept[:, region]
+        if cache:
+            kept_terms = kept_terms[:, region]
+    if cache:
+        return kept, kept_terms
+    return kept
+
+
+def _ellipse_results(occultations, values, chord_name, chisquare):
+    """ Saves the fitted parameters, the radial dispersion and the chi square of an ellipse fit
+        in fitted_params and chi2_params of the occultations.
+
+    Parameters:
+        occultations (list): The Occultation objects.
+        values (list): List with f, g and the error of each chord position, in km.
+        chord_name (list): Name of each chord position.
+        chisquare (ChiSquare): The result of the fit.
+    """
+    onesigma = chisquare.get_nsigma(sigma=1)
+    a = onesigma['equatorial_radius'][0]
+    f0 = onesigma['center_f'][0]
+    g0 = onesigma['center_g'][0]
+    obla = onesigma['oblateness'][0]
+    phi_deg = onesigma['position_angle'][0]
+    fi, gi, error_bar = np.array(values, dtype=float).reshape(-1, 3).T
+    b = a - a*obla
+    phi = phi_deg*(np.pi/180.0)
+    dfi = fi-f0
+    dgi = gi-g0
+    r = np.sqrt(dfi**2 + dgi**2)
+    theta = np.arctan2(dgi, dfi)
+    ang = theta+phi
+    r_model = (a*b)/np.sqrt((a*np.sin(ang))**2 + (b*np.cos(ang))**2)
+    radial_dispersion = r - r_model
+
+    for occ in occultations:
+        if type(occ) == Occultation:
+            occ.fitted_params = {i: onesigma[i] for i in ['equatorial_radius', 'center_f', 'center_g',
+                                                          'oblateness', 'position_angle']}
+            occ.chi2_params = {'chord_name': chord_name}
+            occ.chi2_params['radial_dispersion'] = radial_dispersion
+            occ.chi2_params['radial_error'] = error_bar
+            occ.chi2_params['chi2_min'] = onesigma['chi2_min']
+            occ.chi2_params['nparam'] = chisquare.nparam
+            occ.chi2_params['npts'] = chisquare.npts
+
+
+class ChordCache():
+    def __init__(self, occultations, values, chord_name, chisquare, terms):
+        """ Keeps the squared residual of each chord position for all the ellipses of a fit, so the
+            fit can be repeated without some positions, or with other error bars, by summing them.
+
+        It is created by fit_ellipse() with cache=True and saved in the attribute chord_cache of the
+        occultations. The residuals are kept as float32, so the chi square of refit() has a relative
+        precision of about 1e-7.
+
+        Parameters:
+            occultations (list): The Occultation objects of the fit.
+            values (list): List with f, g and the error of each chord position, in km.
+            chord_name (list): Name of each chord position, e.g. 'Observer_immersion'.
+            chisquare (ChiSquare): The result of the fit.
+            terms (ColumnStore): Squared residual of each position for each ellipse of chisquare.
+        """
+        self.occultations = list(occultations)
+        self.values = [list(value) for value in values]
+        self.chord_name = list(chord_name)
+        self.chisquare = chisquare
+        self.terms = terms
+
+    def __positions(self, names):
+        """ Private function that returns the indexes of the positions of the given chords or positions
+        """
+        indexes = []
+        for name in names:
+            name = name.replace(' ', '_')
+            found = [i for i, chord in enumerate(self.chord_name) if name in [chord, chord.rsplit('_', 1)[0]]]
+            if not found:
+                raise ValueError('{} is not one of the chords fitted: {}'.format(name, self.chord_name))
+            indexes += found
+        return indexes
+
+    def refit(self, exclude=None, errors=None):
+        """ Recomputes the chi square of the ellipses without the excluded positions and with new error bars.
+
+        The fitted parameters and the chi square of the occultations are updated, as in fit_ellipse().
+        chi2_params is created again, so the least squares solution of method='lsq' or 'hybrid'
+        (chi2_params['lsq']) is removed, since it was fitted to all the positions.
+
+        Parameters:
+            exclude (list): Names of the chords (e.g. 'Observer') or of the positions (e.g. 'Observer_immersion')
+                that are not used. Default=None
+            errors (dict): New radial error, in km, of chords or positions, e.g. {'Observer_emersion': 2.5}.
+                Default=None
+
+        Returns:
+            chisquare: A ChiSquare object with all parameters.
+        """
+        error_bar = np.array([value[2] for value in self.values], dtype=float)
+        for name, error in (errors or {}).items():
+            if error <= 0:
+                raise ValueError('The error of {} must be positive'.format(name))
+            error_bar[self.__positions([name])] = error
+        used = np.ones(len(self.values), dtype=bool)
+        used[self.__positions(exclude or [])] = False
+        if not used.any():
+            raise ValueError('At least one chord position must be used')
+        chi2 = np.zeros(len(self.chisquare.data['chi2']))
+        for k in np.flatnonzero(used):
+            chi2 += self.terms[k]*(1/error_bar[k]**2)
+        params = {name: self.chisquare.data[name] for name in ['center_f', 'center_g', 'equatorial_radius',
+                                                               'oblateness', 'position_angle']}
+        chisquare = ChiSquare(chi2, int(used.sum()), **params)
+        values = [[f, g, error] for (f, g, _), error, do in zip(self.values, error_bar, used) if do]
+        chord_name = [name for name, do in zip(self.chord_name, used) if do]
+        # chi2_params is created again, dropping the least squares solution fitted to all the positions
+        _ellipse_results(self.occultations, values, chord_name, chisquare)
+        return chisquare
+
+
 @deprecated_alias(pos_angle='position_angle', dpos_angle='dposition_angle')  # remove this line for v1.0
 def fit_ellipse(*args, equatorial_radius, dequatorial_radius=0, center_f=0, dcenter_f=0, center_g=0,
                 dcenter_g=0, oblateness=0, doblateness=0, position_angle=0, dposition_angle=0,
-                loop=10000000, number_chi=10000, dchi_min=None, log=False):
+                loop=10000000, number_chi=10000, dchi_min=None, memory_limit=256, seed=None, workers=1,
+                executor=None, method='montecarlo', box_sigma=5, cache=False, scratch=None, log=False):
     """ Fits an ellipse to given occultation using given parameters
 
     Parameters:
@@ -89,9 +355,39 @@ def fit_ellipse(*args, equatorial_radius, dequatorial_radius=0, center_f=0, dcen
 
         loop (int): The number of ellipses to attempt fitting. Default: 10,000,000
         dchi_min (intt,float): If given, it will only save ellipsis which chi square are
-            smaller than chi_min + dchi_min.
+            smaller than chi_min + dchi_min, where chi_min is the minimum of all the ellipses tested.
         number_chi (int): if dchi_min is given, the procedure is repeated until
             number_chi is reached. Default: 10,000
+        memory_limit (int,float): Approximate memory, in MB, of the buffers used to evaluate the ellipses.
+            The loop is evaluated in chunks that fit in it, in each process. The ellipses saved are not included.
+            Default: 256
+        seed (int): Seed of the random number generator, to reproduce the fit. For a given seed and
+            memory_limit, the result does not depend on the number of workers. Default: None
+        workers (int): Number of processes used to evaluate the ellipses. Default: 1
+        executor (concurrent.futures.Executor): Executor used to evaluate the ellipses, instead of a new
+            process pool. If given, workers is not used. Default: None
+        method (str): Method of the fit. Default: 'montecarlo'
+            'montecarlo' tests "loop" random ellipses within the given intervals.
+            'lsq' fits the ellipse by non-linear least squares, starting from the given values, and returns
+                number_chi ellipses drawn from the covariance of the fit. The parameters with a non-zero interval
+                are fitted, but the intervals are not used as limits. The ellipses with a radius that is not
+                positive are drawn again, up to 100 times, and a ValueError is raised if some radius is still
+                not positive. The oblateness is clipped between 0 and 1. If dchi_min is given,
+                only the ellipses drawn within dchi_min of the fit are returned, so there may be less than
+                number_chi, and no new ellipses are drawn.
+            'hybrid' fits the ellipse as in 'lsq' and then tests "loop" random ellipses within box_sigma times
+                the errors of the fit.
+            With 'lsq' and 'hybrid', the fitted values, their errors and the covariance are saved in
+            chi2_params['lsq'] of the occultations.
+        box_sigma (int,float): Half-width of the intervals tested with method='hybrid', in units of the
+            errors of the least squares fit. Default: 5
+        cache (bool): If True, the squared residual of each chord position is kept for all the ellipses
+            saved, as float32, in a ChordCache saved in the attribute chord_cache of the occultations.
+            The fit can then be repeated without some chords or with other error bars with
+            Occultation.refit_ellipse(), without testing new ellipses. With dchi_min, only the ellipses
+            saved are cached. Default: False
+        scratch (str): Directory where the cached residuals are memory-mapped to a temporary file,
+            instead of being kept in memory. Default: None
         log (bool): If True, it prints information while fitting. Default: False.
 
     Returns:
@@ -128,91 +424,114 @@ def fit_ellipse(*args, equatorial_radius, dequatorial_radius=0, center_f=0, dcen
                         values.append([f, g, erro])
                         chord_name.append(lc.replace(' ', '_') + '_emersion')
 
+    if method not in ['montecarlo', 'lsq', 'hybrid']:
+        raise ValueError('method must be "montecarlo", "lsq" or "hybrid"')
+    if scratch is not None and not os.path.isdir(scratch):
+        raise ValueError('{} is not a directory'.format(scratch))
     controle_f0 = Time.now()
-    f0_chi = np.array([])
-    g0_chi = np.array([])
-    a_chi = np.array([])
-    obla_chi = np.array([])
-    posang_chi = np.array([])
-    chi2_best = np.array([])
-
-    while (len(f0_chi) < number_chi):
-        chi2 = np.zeros(loop)
-        f0 = center_f + dcenter_f*(2*np.random.random(loop) - 1)
-        g0 = center_g + dcenter_g*(2*np.random.random(loop) - 1)
-        a = equatorial_radius + dequatorial_radius*(2*np.random.random(loop) - 1)
-        obla = oblateness + doblateness*(2*np.random.random(loop) - 1)
-        obla[obla < 0], obla[obla > 1] = 0, 1
-        phi_deg = position_angle + dposition_angle*(2*np.random.random(loop) - 1)
-        controle_f1 = Time.now()
-
-        for fi, gi, si in values:
-            b = a - a*obla
-            phi = phi_deg*(np.pi/180.0)
-            dfi = fi-f0
-            dgi = gi-g0
-            r = np.sqrt(dfi**2 + dgi**2)
-            theta = np.arctan2(dgi, dfi)
-            ang = theta+phi
-            r_model = (a*b)/np.sqrt((a*np.sin(ang))**2 + (b*np.cos(ang))**2)
-            f_model = f0 + r_model*np.cos(theta)
-            g_model = g0 + r_model*np.sin(theta)
-            chi2 += ((fi - f_model)**2 + (gi - g_model)**2)/(si**2)
-
-        controle_f2 = Time.now()
-        if dchi_min is not None:
-            region = np.where(chi2 < chi2.min() + dchi_min)[0]
-        else:
-            region = np.arange(len(chi2))
-        chi2_best = np.append(chi2_best, chi2[region])
+    seed = np.random.SeedSequence(seed)
+    names = ['center_f', 'center_g', 'equatorial_radius', 'oblateness', 'position_angle']
+    centers = [center_f, center_g, equatorial_radius, oblateness, position_angle]
+    deltas = [dcenter_f, dcenter_g, dequatorial_radius, doblateness, dposition_angle]
+    lsq = None
+    if method != 'montecarlo':
+        free = [delta != 0 for delta in deltas]
+        if not any(free):
+            raise ValueError('At least one parameter must have a non-zero interval to be fitted')
+        params, covariance, chi2_lsq = _ellipse_lsq(values, centers, free)
+        errors = np.sqrt(np.diag(covariance))
+        lsq = {name: [value, error] for name, value, error in zip(names, params, errors)}
+        lsq['chi2_min'] = chi2_lsq
+        lsq['covariance'] = covariance
         if log:
-            print('Elapsed time: {:.3f} seconds.'.format((controle_f2 - controle_f1).sec))
-            print(len(chi2[region]), len(chi2_best))
-        f0_chi = np.append(f0_chi, f0[region])
-        g0_chi = np.append(g0_chi, g0[region])
-        a_chi = np.append(a_chi, a[region])
-        obla_chi = np.append(obla_chi, obla[region])
-        posang_chi = np.append(posang_chi, phi_deg[region])
-
-    chisquare = ChiSquare(chi2_best, len(values), center_f=f0_chi, center_g=g0_chi, equatorial_radius=a_chi,
-                          oblateness=obla_chi, position_angle=posang_chi)
+            print('Least squares fit: chi2 = {:.3f}'.format(chi2_lsq))
+            print('\n'.join('    {}: {:.3f} +/- {:.3f}'.format(name, *lsq[name]) for name in names))
+        # the ellipses are tested around the fit, keeping the given interval where the error is undefined
+        centers = list(params)
+        deltas = [box_sigma*error if (do and np.isfinite(error) and error > 0) else delta
+                  for do, error, delta in zip(free, errors, deltas)]
+    # the loop is divided in blocks with independent random streams, evaluated by the executor
+    block = 2**20
+    sizes = [min(block, loop - start) for start in range(0, loop, block)]
+    pool = None
+    if executor is None and workers > 1 and method != 'lsq':
+        executor = pool = ProcessPoolExecutor(max_workers=workers)
+    kept = ColumnStore(['chi2', 'center_f', 'center_g', 'equatorial_radius', 'oblateness', 'position_angle'],
+                       capacity=number_chi)
+    terms = ColumnStore(range(len(values)), capacity=number_chi, dtype=np.float32, scratch=scratch) if cache else None
+    chi2_min = np.inf
+    if method != 'montecarlo':
+        # the fitted ellipse and, with 'lsq', number_chi - 1 ellipses drawn from the covariance
+        rng = np.random.default_rng(seed)
+        tests = np.empty((16, number_chi if method == 'lsq' else 1))
+        tests[:5] = rng.multivariate_normal(params, covariance, size=tests.shape[1]).T
+        tests[:5, 0] = params
+        # the ellipses with a radius that is not positive are drawn again, a limited number of times
+        invalid = np.flatnonzero(tests[2] <= 0)
+        for _ in range(100):
+            if len(invalid) == 0:
+                break
+            tests[:5, invalid] = rng.multivariate_normal(params, covariance, size=len(invalid)).T
+            invalid = invalid[tests[2, invalid] <= 0]
+        if len(invalid) > 0:
+            raise ValueError('The least squares fit gives an equatorial radius of {:.3f} +/- {:.3f} km, and no '
+                             'positive radius could be drawn from its covariance. Give a positive '
+                             'equatorial_radius with dequatorial_radius=0, or use method="montecarlo".'
+                             .format(params[2], errors[2]))
+        np.clip(tests[3], 0, 1, out=tests[3])
+        tests_terms = np.empty((len(values), tests.shape[1]), dtype=np.float32) if cache else None
+        _ellipse_chi2(values, *tests[:5], tests[5], tests[6:], terms=tests_terms)
+        kept.append(np.vstack((tests[5], tests[:5])), tested=0)
+        if cache:
+            terms.append(tests_terms, tested=0)
+        chi2_min = tests[5].min()
+        if dchi_min is not None:
+            region = kept['chi2'] < chi2_min + dchi_min
+            kept.keep(region)
+            if cache:
+                terms.keep(region)
+    try:
+        while method != 'lsq' and len(kept) < number_chi:
+            tasks = [(values, block_seed, size, centers, deltas, dchi_min, memory_limit, cache)
+                     for block_seed, size in zip(seed.spawn(len(sizes)), sizes)]
+            if executor is None:
+                blocks = [_ellipse_block(*task) for task in tasks]
+            else:
+                blocks = list(executor.map(_ellipse_block, *zip(*tasks)))
+            if cache:
+                blocks, blocks_terms = zip(*blocks)
+                terms.append(np.hstack(blocks_terms), tested=loop)
+            # each block is pruned with its own minimum, so pruning the merged ellipses with the
+            # minimum of all the blocks and iterations gives the same result for any number of workers
+            chi2_min = min([chi2_min] + [b[0].min() for b in blocks if b.shape[1] > 0])
+            kept.append(np.hstack(blocks), tested=loop)
+            if dchi_min is not None:
+                region = kept['chi2'] < chi2_min + dchi_min
+                kept.keep(region)
+                if cache:
+                    terms.keep(region)
+            if log:
+                progress = kept.progress()
+                print('Iteration {iterations}: {tested} ellipses tested, {kept} kept. Elapsed time: {elapsed:.3f} '
+                      'seconds ({throughput:.0f} ellipses per second).'.format(**progress))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    chisquare = kept.to_chisquare(len(values))
     controle_f4 = Time.now()
     if log:
         print('Total elapsed time: {:.3f} seconds.'.format((controle_f4 - controle_f0).sec))
 
-    onesigma = chisquare.get_nsigma(sigma=1)
-    a = onesigma['equatorial_radius'][0]
-    f0 = onesigma['center_f'][0]
-    g0 = onesigma['center_g'][0]
-    obla = onesigma['oblateness'][0]
-    phi_deg = onesigma['position_angle'][0]
-    radial_dispersion = np.array([])
-    error_bar = np.array([])
-
-    for fi, gi, si in values:
-        b = a - a*obla
-        phi = phi_deg*(np.pi/180.0)
-        dfi = fi-f0
-        dgi = gi-g0
-        r = np.sqrt(dfi**2 + dgi**2)
-        theta = np.arctan2(dgi, dfi)
-        ang = theta+phi
-        r_model = (a*b)/np.sqrt((a*np.sin(ang))**2 + (b*np.cos(ang))**2)
-        f_model = f0 + r_model*np.cos(theta)
-        g_model = g0 + r_model*np.sin(theta)
-        radial_dispersion = np.append(radial_dispersion, r - r_model)
-        error_bar = np.append(error_bar, si)
-
+    _ellipse_results(args, values, chord_name, chisquare)
+    chord_cache = ChordCache(args, values, chord_name, chisquare, terms) if cache else None
     for occ in args:
-        if type(occ) == Occultation:
-            occ.fitted_params = {i: onesigma[i] for i in ['equatorial_radius', 'center_f', 'center_g',
-                                                          'oblateness', 'position_angle']}
-            occ.chi2_params = {'chord_name': chord_name}
-            occ.chi2_params['radial_dispersion'] = radial_dispersion
-            occ.chi2_params['radial_error'] = error_bar
-            occ.chi2_params['chi2_min'] = chisquare.get_nsigma()['chi2_min']
-            occ.chi2_params['nparam'] = chisquare.nparam
-            occ.chi2_params['npts'] = chisquare.npts
+        if lsq is not None:
+            occ.chi2_params['lsq'] = lsq
+        if chord_cache is not None:
+            occ.chord_cache = chord_cache
+        elif hasattr(occ, 'chord_cache'):
+            del occ.chord_cache
     return chisquare
 
 
@@ -419,9 +738,25 @@ class Occultation():
 
             loop (int): The number of ellipses to attempt fitting. Default: 10,000,000
             dchi_min (int,float): If given, it will only save ellipsis which chi square are
-                smaller than chi_min + dchi_min.
+                smaller than chi_min + dchi_min, where chi_min is the minimum of all the ellipses tested.
             number_chi (int): if dchi_min is given, the procedure is repeated until
                 number_chi is reached. Default: 10,000
+            memory_limit (int,float): Approximate memory, in MB, of the buffers used to evaluate the
+                ellipses. The loop is evaluated in chunks that fit in it, in each process. Default: 256
+            seed (int): Seed of the random number generator, to reproduce the fit. Default: None
+            workers (int): Number of processes used to evaluate the ellipses. Default: 1
+            executor (concurrent.futures.Executor): Executor used instead of a new process pool.
+                If given, workers is not used. Default: None
+            method (str): 'montecarlo' tests random ellipses within the given intervals. 'lsq' fits the
+                ellipse by non-linear least squares, fitting the parameters with a non-zero interval, and
+                draws number_chi ellipses from its covariance, pruned with dchi_min if it is given. 'hybrid'
+                tests random ellipses within box_sigma times the errors of the least squares fit.
+                Default: 'montecarlo'
+            box_sigma (int,float): Half-width of the intervals tested with method='hybrid', in units of the
+                errors of the least squares fit. Default: 5
+            cache (bool): If True, the residual of each chord position is kept for all the ellipses saved,
+                so refit_ellipse() can repeat the fit without some chords. Default: False
+            scratch (str): Directory where the cached residuals are memory-mapped. Default: None
             log (bool): If True, it prints information while fitting. Default: False.
 
         Returns:
@@ -430,6 +765,26 @@ class Occultation():
         chisquare = fit_ellipse(self, **kwargs)
         return chisquare
 
+    def refit_ellipse(self, exclude=None, errors=None):
+        """ Repeats the last ellipse fit without some chords or with other error bars,
+            using the residuals cached by fit_ellipse(cache=True)
+
+        fitted_params and chi2_params are updated. chi2_params['lsq'], saved by fit_ellipse() with
+        method='lsq' or 'hybrid', is removed, since it was fitted to all the positions.
+
+        Parameters:
+            exclude (list): Names of the chords (e.g. 'Observer') or of the positions (e.g. 'Observer_immersion')
+                that are not used. Default=None
+            errors (dict): New radial error, in km, of chords or positions, e.g. {'Observer_emersion': 2.5}.
+                Default=None
+
+        Returns:
+            chisquare: A ChiSquare object with all parameters.
+        """
+        if not hasattr(self, 'chord_cache'):
+            raise ValueError('There is no cached fit. Please run fit_ellipse() with cache=True')
+        return self.chord_cache.refit(exclude=exclude, errors=errors)
+
     @property
     def positions(self):
         """ Calculates the position and velocity for all chords.
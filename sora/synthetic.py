@@ -0,0 +1,71 @@
+import numpy as np
+import warnings
+from .lightcurve import LightCurve
+
+
+def synthetic_lightcurve(name, immersion_time, emersion_time, vel, dist, d_star=0.0, exptime=0.1, cycle=None,
+                         noise=0.0, opacity=1.0, central_bandpass=0.70, delta_bandpass=0.30, tmin=None, tmax=None,
+                         flux_min=0.0, flux_max=1.0, tref='2000-01-01 00:00', seed=None, **kwargs):
+    """ Creates a LightCurve with a synthetic occultation.
+        (The flux is the model of LightCurve.occ_model() plus gaussian noise)
+
+    Parameters:
+        name (str): Name of the LightCurve.
+        immersion_time (int, float): Immersion time, in seconds relative to tref.
+        emersion_time (int, float): Emersion time, in seconds relative to tref.
+        vel (int, float): Occultation velocity, in km/s.
+        dist (int, float): Object distance, in AU.
+        d_star (int, float): Star diameter, in km. Default=0.0
+        exptime (int, float): Exposure time, in seconds. Default=0.1
+        cycle (int, float): Time between the start of two exposures, in seconds. Default=exptime
+        noise (int, float): Standard deviation of the gaussian noise, relative to flux_max - flux_min.
+            Default=0.0
+        opacity (int, float): Opacity. Opaque = 1.0, transparent = 0.0. Default=1.0
+        central_bandpass (float): Center band of the filter, in microns. Default=0.70
+        delta_bandpass (float): Bandwidth of the filter, in microns. Default=0.30
+        tmin (int, float): Start of the light curve, in seconds. Default=immersion_time minus
+            twice the occultation duration or 10 cycles, the largest.
+        tmax (int, float): End of the light curve, in seconds. Default=emersion_time plus
+            twice the occultation duration or 10 cycles, the largest.
+        flux_min (int, float): Bottom flux (only object). Default=0.0
+        flux_max (int, float): Base flux (object plus star). Default=1.0
+        tref (Time, str, float): Instant of reference. Default='2000-01-01 00:00'
+        seed (int): Seed of the noise. Default=None
+    Kwargs:
+        npt_star, time_resolution_factor, star_method, adaptive_grid: Parameters of LightCurve.occ_model().
+
+    Returns:
+        lc (LightCurve): The synthetic light curve, with the flux error in dflux if noise is given.
+    """
+    if emersion_time <= immersion_time:
+        raise ValueError('emersion_time must be greater than immersion_time')
+    if exptime <= 0:
+        raise ValueError('Exposure time can not be zero or negative')
+    if cycle is None:
+        cycle = exptime
+    if cycle <= 0:
+        raise ValueError('cycle must be positive')
+    margin = max(2*(emersion_time - immersion_time), 10*cycle)
+    if tmin is None:
+        tmin = immersion_time - margin
+    if tmax is None:
+        tmax = emersion_time + margin
+    if tmax <= tmin:
+        raise ValueError('tmax must be greater than tmin')
+    time = tmin + cycle*np.arange(int(np.floor((tmax - tmin)/cycle)) + 1)
+    with warnings.catch_warnings():
+        if cycle >= exptime:
+            # the cycle computed from the Time object may be slightly shorter than the exposure
+            warnings.filterwarnings('ignore', message='Exposure time')
+        lc = LightCurve(name=name, time=time, flux=np.ones(len(time)), exptime=exptime, tref=tref, vel=vel,
+                        dist=dist, d_star=d_star, central_bandpass=central_bandpass, delta_bandpass=delta_bandpass)
+        lc.occ_model(immersion_time, emersion_time, opacity, np.ones(len(time), dtype=bool),
+                     flux_min=flux_min, flux_max=flux_max, **kwargs)
+        flux = np.array(lc.model)
+        rng = np.random.default_rng(seed)
+        flux += noise*(flux_max - flux_min)*rng.standard_normal(len(time))
+        data = {'time': time, 'flux': flux}
+        if noise > 0:
+            data['dflux'] = np.full(len(time), noise*(flux_max - flux_min))
+        lc.set_flux(exptime=exptime, **data)
+    return lc